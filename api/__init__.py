@@ -13,6 +13,11 @@ map: classes, functions and constants for working with the game map and
     
     Map -- represents the state of the entire game board.
     MapSquare -- represents an individual square on the map.
-    Company -- represents a company on the board (location and any passengers).
+    Company -- represents a company on the board (location and any passengers,
+        and whose enemies are among them - see Company.wouldRefuse).
+
+path: a compact path of map tiles.
+
+    Path -- a sequence of (x, y) tiles held as an array of packed tile ids.
 
 """
@@ -11,7 +11,11 @@ No copyright claimed - do anything you want with this code.
 from __future__ import print_function
 from __future__ import division
 
+from functools import reduce
+
 import debug
+import landmarks
+import travelTime
 
 DIRECTION = {"NORTH_SOUTH":0, "EAST_WEST":1, "INTERSECTION":2,
              "NORTH_UTURN":3, 'EAST_UTURN':4, 'SOUTH_UTURN':5, 'WEST_UTURN':6,
@@ -60,6 +64,15 @@ class Map(object):
             map units and some are in tile units.
         width -- the width of the map. Units are squares.
         height -- The height of the map. Units are squares.
+        grid -- bytearray, 1 for each driveable tile, indexed x * height + y
+            (see landmarks.driveableGrid).
+        landmarks -- landmarks.Landmarks for the path search heuristic (None
+            if landmarks.COUNT is 0). Built the first time it is used.
+        entryCosts -- array, the cost of entering each tile in each heading
+            from its stop signs, signal and shape, indexed
+            (x * height + y) * 4 + heading (see travelTime). Built the first
+            time it is used, with turnCosts.
+        turnCosts -- bytearray, the extra cost of turning on each tile.
 
         """
         self.width  = width  = int(element.get('width'))
@@ -73,6 +86,28 @@ class Map(object):
         for company in companies:
             squares[company.busStop[0]][company.busStop[1]].setCompany(company)
         self.squares = squares
+        self.grid = landmarks.driveableGrid(self)
+        # only a brain that routes with them needs these - see the properties
+        self._landmarks = None
+        self._tileCosts = None
+
+    @property
+    def landmarks(self):
+        if self._landmarks is None and landmarks.COUNT:
+            self._landmarks = landmarks.Landmarks(self)
+        return self._landmarks
+
+    @property
+    def entryCosts(self):
+        if self._tileCosts is None:
+            self._tileCosts = travelTime.tileCosts(self)
+        return self._tileCosts[0]
+
+    @property
+    def turnCosts(self):
+        if self._tileCosts is None:
+            self._tileCosts = travelTime.tileCosts(self)
+        return self._tileCosts[1]
 
     def squareOrDefault(self, point):
         """Return the requested point or None if off the map."""
@@ -125,11 +160,40 @@ class Company(object):
         name -- The name of the company.
         busStop -- The tile with the company's bus stop.
         passengers -- List of Passengers waiting at this company's bus stop.
+            Change it with arrive and leave, which keep enemiesWaiting.
+        enemiesWaiting -- {Passenger: number of their enemies in passengers}
+            for every passenger with at least one.
 
         """
         self.name = element.get('name')
         self.busStop = ( int(element.get('bus-stop-x')), int(element.get('bus-stop-y')) )
         self.passengers = []
+        self.enemiesWaiting = {}
+
+    def arrive(self, passenger):
+        """passenger is now waiting here."""
+        if passenger in self.passengers:
+            return
+        self.passengers.append(passenger)
+        waiting = self.enemiesWaiting
+        for other in passenger.enemyOf:
+            waiting[other] = waiting.get(other, 0) + 1
+
+    def leave(self, passenger):
+        """passenger is no longer waiting here."""
+        if passenger not in self.passengers:
+            return
+        self.passengers.remove(passenger)
+        waiting = self.enemiesWaiting
+        for other in passenger.enemyOf:
+            if waiting[other] == 1:
+                del waiting[other]
+            else:
+                waiting[other] -= 1
+
+    def wouldRefuse(self, passenger):
+        """True if passenger would not get out here (an enemy is waiting)."""
+        return passenger in self.enemiesWaiting
 
     def __str__(self):
         return "%s; %s" % (self.name, self.busStop)
@@ -140,5 +204,11 @@ class Company(object):
         else:
             return False
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.name)
+
 def companiesFromXml(element):
     return [Company(e) for e in element.findall('company')]
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Module path: a compact path of map tiles.
+
+Path -- a mutable sequence of (x, y) tiles, held as one array of tile ids.
+tileId(x, y) / tileXY(tileId) -- pack and unpack a tile id.
+
+A tile id is x << 16 | y, so a path of n tiles is 4n bytes in an array
+instead of a list of n tuples. Indexing and iterating a Path give (x, y)
+tuples as a list of tiles would, so code written for lists works unchanged;
+code that cares about speed works on Path.ids directly. Path.parse and
+Path.format read and write the "x,y;x,y;" text of <path> elements in bulk.
+
+x must be in 0..32767 and y in 0..65535 (ids are signed 32-bit ints).
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from array import array
+try:
+    from collections.abc import MutableSequence
+except ImportError: # Python 2
+    from collections import MutableSequence
+
+TYPECODE = 'i'
+
+
+def tileId(x, y):
+    return x << 16 | y
+
+def tileXY(tile):
+    return (tile >> 16, tile & 0xFFFF)
+
+
+class Path(MutableSequence):
+    """A sequence of (x, y) tiles stored as an array of tile ids."""
+    __slots__ = ('ids',)
+
+    def __init__(self, tiles=()):
+        """tiles -- (x, y) tiles (or another Path) to start with.
+        ids -- array of the tile ids.
+
+        """
+        if isinstance(tiles, Path):
+            self.ids = array(TYPECODE, tiles.ids)
+        else:
+            self.ids = array(TYPECODE, [x << 16 | y for x, y in tiles])
+
+    @classmethod
+    def fromIds(cls, ids):
+        """A Path on the array ids (not copied)."""
+        path = cls.__new__(cls)
+        path.ids = ids
+        return path
+
+    @classmethod
+    def parse(cls, text):
+        """A Path from the text of a <path> element: "x,y;x,y;..."."""
+        values = [int(v) for v in text.replace(';', ' ').replace(',', ' ').split()]
+        return cls.fromIds(array(TYPECODE, [x << 16 | y for x, y in
+                                            zip(values[0::2], values[1::2])]))
+
+    def format(self):
+        """The text of a <path> element for this path: "x,y;x,y;..."."""
+        ids = self.ids
+        values = [0] * (2 * len(ids))
+        values[0::2] = [tile >> 16 for tile in ids]
+        values[1::2] = [tile & 0xFFFF for tile in ids]
+        return ('%d,%d;' * len(ids)) % tuple(values)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Path.fromIds(self.ids[index])
+        tile = self.ids[index]
+        return (tile >> 16, tile & 0xFFFF)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.ids[index] = Path(value).ids
+        else:
+            self.ids[index] = value[0] << 16 | value[1]
+
+    def __delitem__(self, index):
+        del self.ids[index]
+
+    def insert(self, index, value):
+        self.ids.insert(index, value[0] << 16 | value[1])
+
+    def append(self, value):
+        self.ids.append(value[0] << 16 | value[1])
+
+    def extend(self, values):
+        self.ids.extend(Path(values).ids)
+
+    def pop(self, index=-1):
+        tile = self.ids.pop(index)
+        return (tile >> 16, tile & 0xFFFF)
+
+    def __iter__(self):
+        for tile in self.ids:
+            yield (tile >> 16, tile & 0xFFFF)
+
+    def __contains__(self, value):
+        return value[0] << 16 | value[1] in self.ids
+
+    def __eq__(self, other):
+        if isinstance(other, Path):
+            return self.ids == other.ids
+        try:
+            return len(self) == len(other) and all(
+                mine == tuple(theirs) for mine, theirs in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __add__(self, other):
+        path = Path(self)
+        path.extend(other)
+        return path
+
+    def __radd__(self, other):
+        path = Path(other)
+        path.extend(self)
+        return path
+
+    def __repr__(self):
+        return "Path(%r)" % (list(self),)
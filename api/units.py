@@ -11,6 +11,12 @@ No copyright claimed - do anything you want with this code.
 
 from xml.etree import ElementTree as ET
 import debug
+from api.path import Path
+
+try:
+    basestring
+except NameError: # Python 3
+    basestring = str
 
 STATUS = ("UPDATE", "NO_PATH", "PASSENGER_ABANDONED", "PASSENGER_DELIVERED",
           "PASSENGER_DELIVERED_AND_PICKED_UP", "PASSENGER_REFUSED",
@@ -83,8 +89,8 @@ class Limo(object):
         """tilePosition -- The location in tile units of the center of the vehicle.
         angle -- the angle this unit is facing (an int from 0 to 359; 0 is
             North and 90 is East.
-        path -- Only set for the AI's own limo - the number of tiles
-            remaining in the limo's path. This may be wrong after movement
+        path -- Only set for the AI's own limo - the tiles remaining in the
+            limo's path (an api.path.Path). This may be wrong after movement
             as all we get is a count. This is updated witht the most recent
             list sent to the server.
         passenger -- The passenger in this limo. None if there is no passenger.
@@ -92,7 +98,7 @@ class Limo(object):
         """
         self.tilePosition = tilePosition
         self.angle = angle
-        self.path = path if path else []
+        self.path = Path(path)
         self.passenger = passenger
 
     def __str__(self):
@@ -122,6 +128,7 @@ class Passenger(object):
             stop, this passenger will not exit the limo at that stop. If a
             passenger at the bus stop has this passenger as an enemy, this
             passenger can still exit the car.
+        enemyOf -- List of the Passengers who have this passenger as an enemy.
 
         """
         self.name = element.get('name')
@@ -138,6 +145,7 @@ class Passenger(object):
             route.append([c for c in companies if c.name == routeElement.text][0])
         self.route = route
         self.enemies = []
+        self.enemyOf = []
         self.car = None
 
     def __repr__(self):
@@ -147,76 +155,168 @@ def playersFromXml (element):
     """Called on setup to create initial list of players."""
     return [Player(p) for p in element.findall('player')]
 
-def updatePlayersFromXml (players, passengers, element):
-    """Update a list of Player objects with passengers from the given XML."""
+class ChangeSet(object):
+    """What one status message changed. Filled in by updatePlayersFromXml and
+    updatePassengersFromXml when they are passed one."""
+
+    def __init__(self):
+        """movedLimos -- Players whose limo moved or turned.
+        limoPassengerChanged -- Players whose limo passenger changed.
+        scoreChanged -- Players whose score changed.
+        delivered -- Players told about a new delivery.
+        lobbyChanged -- Passengers who arrived at or left a lobby.
+        carChanged -- Passengers who got in or out of a limo.
+        destinationChanged -- Passengers whose destination changed.
+        companiesGained -- Companies with a new passenger waiting.
+        companiesLost -- Companies a waiting passenger left.
+
+        """
+        self.movedLimos = set()
+        self.limoPassengerChanged = set()
+        self.scoreChanged = set()
+        self.delivered = set()
+        self.lobbyChanged = set()
+        self.carChanged = set()
+        self.destinationChanged = set()
+        self.companiesGained = set()
+        self.companiesLost = set()
+
+    def passengersChanged(self):
+        """All passengers whose lobby, car or destination changed."""
+        return self.lobbyChanged | self.carChanged | self.destinationChanged
+
+    def companiesChanged(self):
+        return self.companiesGained | self.companiesLost
+
+    def isEmpty(self):
+        return not (self.movedLimos or self.limoPassengerChanged or
+                    self.scoreChanged or self.delivered or self.lobbyChanged or
+                    self.carChanged or self.destinationChanged or
+                    self.companiesGained or self.companiesLost)
+
+    def __repr__(self):
+        return ("ChangeSet<moved=%r, passengers=%r, companies=%r>" %
+                ([p.name for p in self.movedLimos],
+                 [p.name for p in self.passengersChanged()],
+                 [c.name for c in self.companiesChanged()]))
+
+def updatePlayersFromXml (players, passengers, element, changes=None):
+    """Update a list of Player objects with passengers from the given XML.
+
+    Only values that differ are written. If changes (a ChangeSet) is passed
+    in, what changed is recorded in it.
+    """
+    changes = ChangeSet() if changes is None else changes
+    byGuid = dict((p.guid, p) for p in players)
+    byName = dict((p.name, p) for p in passengers)
     for playerElement in element.findall('player'):
-        player = [p for p in players if p.guid == playerElement.get('guid')][0]
-        player.score = float(playerElement.get('score'))
+        player = byGuid[playerElement.get('guid')]
+        limo = player.limo
+        score = float(playerElement.get('score'))
+        if score != player.score:
+            player.score = score
+            changes.scoreChanged.add(player)
         # car location
-        player.limo.tilePosition = ( int(playerElement.get('limo-x')),
-                                     int(playerElement.get('limo-y')) )
-        player.limo.angle = int(playerElement.get('limo-angle'))
+        tilePosition = ( int(playerElement.get('limo-x')),
+                         int(playerElement.get('limo-y')) )
+        angle = int(playerElement.get('limo-angle'))
+        if tilePosition != limo.tilePosition or angle != limo.angle:
+            limo.tilePosition = tilePosition
+            limo.angle = angle
+            changes.movedLimos.add(player)
         # see if we now have a passenger
         psgrName = playerElement.get('passenger')
-        if psgrName is not None:
-            passenger = [p for p in passengers if p.name == psgrName][0]
-            player.limo.passenger = passenger
-            passenger.car = player.limo
-        else:
-            player.limo.passenger = None
+        passenger = byName[psgrName] if psgrName is not None else None
+        if passenger is not limo.passenger:
+            limo.passenger = passenger
+            changes.limoPassengerChanged.add(player)
+        if passenger is not None and passenger.car is not limo:
+            passenger.car = limo
+            changes.carChanged.add(passenger)
         # add most recent delivery if this is the first time we're told.
         psgrName = playerElement.get('last-delivered')
         if psgrName is not None:
-            passenger = [p for p in passengers if p.name == psgrName][0]
+            passenger = byName[psgrName]
             if passenger not in player.passengersDelivered:
                 player.passengersDelivered.append(passenger)
+                changes.delivered.add(player)
+    return changes
 
 def passengersFromXml (element, companies):
     elements = element.findall('passenger')
     passengers = [Passenger(psgr, companies) for psgr in elements]
     # need to now assign enemies - needed all Passenger objects created first
+    byName = dict((p.name, p) for p in passengers)
     for elemOn in elements:
-        psgr = [p for p in passengers if p.name == elemOn.get('name')][0]
-        psgr.enemies = [filter(lambda p: p.name == e.text, passengers)[0]
-                        for e in elemOn.findall('enemy')]
+        psgr = byName[elemOn.get('name')]
+        psgr.enemies = [byName[e.text] for e in elemOn.findall('enemy')]
+        for enemy in psgr.enemies:
+            enemy.enemyOf.append(psgr)
     # set if they're in a lobby
     for psgr in passengers:
         if psgr.lobby is not None:
             company = [c for c in companies if c == psgr.lobby][0]
-            company.passengers.append(psgr)
+            company.arrive(psgr)
     return passengers
 
-def updatePassengersFromXml (passengers, companies, element):
+def updatePassengersFromXml (passengers, companies, element, changes=None):
+    """Update a list of Passenger objects (and the Company lobbies) from the
+    given XML.
+
+    Only values that differ are written. If changes (a ChangeSet) is passed
+    in, what changed is recorded in it.
+    """
+    changes = ChangeSet() if changes is None else changes
+    byName = dict((p.name, p) for p in passengers)
+    companiesByName = dict((c.name, c) for c in companies)
     for psgrElement in element.findall('passenger'):
         #debug.bugprint('updatePassengers XML:', ET.tostring(psgrElement))
         #debug.bugprint('  passengers: ' + str(passengers))
-        passenger = [p for p in passengers if p.name == psgrElement.get('name')][0]
+        passenger = byName[psgrElement.get('name')]
         dest = psgrElement.get('destination')
         if dest is not None:
-            passenger.destination = [c for c in companies if c.name == dest][0]
+            destination = companiesByName[dest]
+            if destination is not passenger.destination:
+                passenger.destination = destination
+                changes.destinationChanged.add(passenger)
             # remove from the route
             if passenger.destination in passenger.route:
                 passenger.route.remove(passenger.destination)
         # set props based on waiting, travelling, done
         switch = psgrElement.get('status')
-		
+
         if   switch == "lobby":
-			cmpny = [c for c in companies if c.name == psgrElement.get('lobby')][0]
-			if passenger.lobby != cmpny:
-				passenger.lobby = cmpny
-				if not(passenger in passenger.lobby.passengers):
-								passenger.lobby.passengers.append(passenger)
-			passenger.car = None
-			
+            cmpny = companiesByName[psgrElement.get('lobby')]
+            if passenger.lobby is not cmpny:
+                _leaveLobby(passenger, changes)
+                passenger.lobby = cmpny
+                cmpny.arrive(passenger)
+                changes.lobbyChanged.add(passenger)
+                changes.companiesGained.add(cmpny)
+            if passenger.car is not None:
+                passenger.car = None
+                changes.carChanged.add(passenger)
+
         elif switch == "travelling":
-			if passenger.lobby != None:
-				passenger.lobby.passengers.remove(passenger)
-				passenger.lobby = None
+            _leaveLobby(passenger, changes)
             # passenger.car set in Player update
         elif switch == "done":
-            debug.trap()
+            if passenger.destination is not None or passenger.car is not None:
+                debug.trap()
+                changes.destinationChanged.add(passenger)
+                changes.carChanged.add(passenger)
+            _leaveLobby(passenger, changes)
             passenger.destination = None
-            passenger.lobby = None
             passenger.car = None
         else:
-            raise TypeError("Invalid passenger status in XML: %r" % switch)
\ No newline at end of file
+            raise TypeError("Invalid passenger status in XML: %r" % switch)
+    return changes
+
+def _leaveLobby(passenger, changes):
+    """Take passenger out of the lobby they are waiting in (if any)."""
+    lobby = passenger.lobby
+    if lobby is not None:
+        lobby.leave(passenger)
+        passenger.lobby = None
+        changes.lobbyChanged.add(passenger)
+        changes.companiesLost.add(lobby)
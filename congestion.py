@@ -0,0 +1,171 @@
+"""
+Module congestion: where the other limos are about to be, as a cost for
+routing (weightedPath.calculateWeightedPath's extraCost).
+
+    layer = Congestion(gmap, tables)
+    layer.update(players, me)          # at setup
+    layer.moved(player)                # for each limo a status says moved
+    path = calculateWeightedPath(gmap, start, end, layer.cost)
+
+Each other limo's next HORIZON tiles are projected: towards its passenger's
+destination if it has one and the distance tables know the way (each step
+to the neighbor one tick closer), else straight on along its heading,
+turning only where the road gives one choice. Every projected tile is
+reserved at the tick the limo should be on it. cost(tile, step) is PENALTY
+ticks for each reservation of tile within WINDOW ticks of now + step -
+entering a tile about when someone else will be there.
+
+The layer is kept up to date piece by piece: moved(player) takes back that
+limo's old reservations and makes new ones, and does nothing if the limo's
+tile, angle and passenger are as they were. Nothing is rebuilt per turn.
+
+Statuses do not say what tick it is, so now is worked out from the limos
+themselves: a limo found k tiles along the projection made at tick t has
+driven for at least k ticks, so it is at least t + k. Every limo (ours too)
+is projected for this, though ours reserves nothing. The reservations of a
+limo that stays still fall behind now and stop costing anything.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import instrument
+
+HORIZON = 12
+"""Tiles ahead of each limo that are reserved."""
+PENALTY = 2
+"""Ticks added for each reservation of a tile we would enter at that time."""
+WINDOW = 1
+"""Ticks either side of a reservation that it costs."""
+HEADINGS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+"""Tile step for limo angles 0 (north), 90, 180 and 270."""
+
+
+class Congestion(object):
+    """Reservations of the tiles the other limos are heading for."""
+
+    def __init__(self, gmap, tables=None, horizon=HORIZON, penalty=PENALTY,
+                 window=WINDOW):
+        """gmap -- The game map.
+        tables -- setupPipeline.DistanceTables to project along, or None.
+        horizon, penalty, window -- See HORIZON, PENALTY and WINDOW.
+        reserved -- {tile index: [ticks at which a limo should be there]}.
+        projections -- {Player: [(tile index, tick)] projected for them}.
+        projectedFrom -- {Player: (tile, angle, passenger)} of the limo when
+            it was projected.
+        now -- The tick (counted from update) the limos are known to have
+            reached.
+        me -- The Player whose limo is projected only to tell the time.
+        generation -- Counts the changes to the reservations, so a result
+            worked out from them can tell if it is still good.
+
+        """
+        self.gmap = gmap
+        self.tables = tables
+        self.horizon = horizon
+        self.penalty = penalty
+        self.window = window
+        self.reserved = {}
+        self.projections = {}
+        self.projectedFrom = {}
+        self.now = 0
+        self.me = None
+        self.generation = 0
+
+    def update(self, players, me=None):
+        """Project every player's limo that has changed. me's reserves
+        nothing."""
+        self.me = me
+        for player in players:
+            self.moved(player)
+
+    def moved(self, player):
+        """Redo player's reservations if their limo has changed. Returns True
+        if it had."""
+        limo = player.limo
+        where = (limo.tilePosition, limo.angle, limo.passenger)
+        if self.projectedFrom.get(player) == where:
+            return False
+        start = instrument.wallClock()
+        reserved = self.reserved
+        mine = player is self.me
+        old = self.projections.get(player, ())
+        if old:
+            # how far along its old projection it got is how long it has been
+            index = limo.tilePosition[0] * self.gmap.height + limo.tilePosition[1]
+            for tile, tick in old[1:]:
+                if tile == index:
+                    self.now = max(self.now, tick)
+                    break
+        if not mine:
+            for tile, tick in old:
+                ticks = reserved[tile]
+                ticks.remove(tick)
+                if not ticks:
+                    del reserved[tile]
+        projection = [(tile, self.now + step) for tile, step in self._project(limo)]
+        if not mine:
+            for tile, tick in projection:
+                reserved.setdefault(tile, []).append(tick)
+        self.projections[player] = projection
+        self.projectedFrom[player] = where
+        self.generation += 1
+        instrument.record('congestion', instrument.wallClock() - start)
+        return True
+
+    def cost(self, tile, step):
+        """Extra ticks for entering tile (an index) after step steps."""
+        ticks = self.reserved.get(tile)
+        if ticks is None:
+            return 0
+        window = self.window
+        tick = self.now + step
+        total = 0
+        for reservedTick in ticks:
+            if -window <= reservedTick - tick <= window:
+                total += self.penalty
+        return total
+
+    def _project(self, limo):
+        gmap = self.gmap
+        grid, width, height = gmap.grid, gmap.width, gmap.height
+
+        def driveable(x, y):
+            return 0 <= x < width and 0 <= y < height and grid[x * height + y]
+
+        x, y = limo.tilePosition
+        projection = [(x * height + y, 0)]
+        stop = None
+        passenger = limo.passenger
+        if (self.tables is not None and passenger is not None and
+            passenger.destination is not None):
+            stop = passenger.destination.busStop
+        heading = int(round(limo.angle / 90)) % 4
+        for step in range(1, self.horizon + 1):
+            ticks = self.tables.distance((x, y), stop) if stop is not None else None
+            if ticks is not None and ticks > 0:
+                # towards their destination
+                for dx, dy in HEADINGS:
+                    if (driveable(x + dx, y + dy) and
+                        self.tables.distance((x + dx, y + dy), stop) == ticks - 1):
+                        break
+                else:
+                    break
+                heading = HEADINGS.index((dx, dy))
+            elif ticks == 0:
+                break # there
+            else:
+                # straight on, or the only way that is not back
+                dx, dy = HEADINGS[heading]
+                if not driveable(x + dx, y + dy):
+                    turns = [h for h in ((heading + 1) % 4, (heading + 3) % 4)
+                             if driveable(x + HEADINGS[h][0], y + HEADINGS[h][1])]
+                    if len(turns) != 1:
+                        break
+                    heading = turns[0]
+                    dx, dy = HEADINGS[heading]
+            x += dx
+            y += dy
+            projection.append((x * height + y, step))
+        return projection
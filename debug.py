@@ -3,9 +3,20 @@ Module debug: various debugging utilities.  Set DEBUG=False to disable them.
 
 trap(message, breakOn) -- used to set code coverage breakpoints in the code.
 bugprint(message) -- same as print, but only works in DEBUG mode.
-printrap(message, breakOn) -- print a message (always), then call trap.
+printrap(message, breakOn) -- log a message as an error (always), then call
+    trap.
 bugprintrap(message, breakOn) -- print a message and call trap (in DEBUG mode).
 
+log -- the "windward" logger. Messages are queued and written to the console
+    by a background thread (see startLogging) so logging never waits on the
+    terminal.
+startLogging(level, stream) -- start the background log writer.
+
+DEBUG is decided once, at import. It is off when Python runs with -O or when
+the environment variable WINDWARD_DEBUG=0; the utilities are then bound to
+functions that do nothing, so each call costs only a call that does
+nothing.
+
 Created on Dec 4, 2011
 
 @author: malcolmm
@@ -14,59 +25,152 @@ No copyright claimed - do anything you want with this code.
 """
 
 from __future__ import print_function
-import time
+import os, sys, time, atexit, logging, threading
+from collections import deque
 
 #To turn off these utilities set this to False
-DEBUG = True
+DEBUG = __debug__ and os.environ.get("WINDWARD_DEBUG", "1") != "0"
+
+_clock = getattr(time, 'perf_counter', time.time)
 
 def startTime():
-    return time.clock()
+    return _clock()
 
 def timeElapsed(since):
-    return time.clock() - since
+    return _clock() - since
 
 class Trap(UserWarning):
     pass
 
-def trap(message="IT'S A TRAP!", breakOn=True):
-    '''Break into the debugger if breakOn evaluates to True. 
-    
-    Raise (and catch) an instance of the Trap exception.
-    With optional error message, pass that message into Trap's constructor.
-    With optional breakOn, raise the exception only if breakOn evaluates to True.
-    
-    **Be sure that your IDE is set to break on caught (Trap or UserWarning) 
-    exceptions.**
-    
-    '''
-    if DEBUG and breakOn: 
-        try:
-            raise Trap(message)
-        except Trap:
-            pass
-
-def bugprint(*args, **kwargs):
-    '''Same as built-in print, but only works in DEBUG mode.'''
-    if DEBUG:
+def _nothing(*args, **kwargs):
+    pass
+
+if DEBUG:
+    def trap(message="IT'S A TRAP!", breakOn=True):
+        '''Break into the debugger if breakOn evaluates to True.
+
+        Raise (and catch) an instance of the Trap exception.
+        With optional error message, pass that message into Trap's constructor.
+        With optional breakOn, raise the exception only if breakOn evaluates to True.
+
+        **Be sure that your IDE is set to break on caught (Trap or UserWarning)
+        exceptions.**
+
+        '''
+        if breakOn:
+            try:
+                raise Trap(message)
+            except Trap:
+                pass
+
+    def bugprint(*args, **kwargs):
+        '''Same as built-in print, but only works in DEBUG mode.'''
         print(*args, **kwargs)
-        
+
+    def bugprintrap(message, breakOn=True):
+        '''Print a message to the console and call trap (in DEBUG mode only).
+
+        If DEBUG is set to True, print message and call trap with that message
+        and the optional breakOn argument.
+        '''
+        print(message)
+        trap(message, breakOn)
+else:
+    trap = bugprint = bugprintrap = _nothing
+
 def printrap(message, breakOn=True):
-    '''Print a message to the console (always), and call trap in DEBUG mode.
-    
-    If DEBUG is set to True, call trap with message and the optional breakOn 
+    '''Log message as an error (always), and call trap in DEBUG mode.
+
+    The message goes through the buffered log writer once startLogging has
+    been called (so it does not wait on the console), else it is printed.
+    If DEBUG is set to True, call trap with message and the optional breakOn
     argument.
     '''
-    print(message)
-    if DEBUG:
-        trap(message, breakOn)
-    
-def bugprintrap(message, breakOn=True):
-    '''Print a message to the console and call trap (in DEBUG mode only).
-    
-    If DEBUG is set to True, print message and call trap with that message 
-    and the optional breakOn argument.
-    '''
-    if DEBUG:
+    if _handler is not None:
+        log.error(message)
+    else:
         print(message)
-        trap(message, breakOn)
-    
+    trap(message, breakOn)
+
+
+log = logging.getLogger("windward")
+log.addHandler(logging.NullHandler())
+log.propagate = False
+
+LOG_LEVEL = os.environ.get("WINDWARD_LOG_LEVEL", "INFO").upper()
+LOG_BUFFER = 10000
+"""Most log records held waiting for the writer. Beyond this the oldest are
+dropped rather than making the caller wait."""
+LOG_INTERVAL = .05
+"""Seconds between writes to the console."""
+
+class BufferedHandler(logging.Handler):
+    """A logging handler that queues records and writes them from a daemon
+    thread. emit() never blocks on I/O."""
+
+    def __init__(self, stream=None, capacity=LOG_BUFFER, interval=LOG_INTERVAL):
+        """stream -- Where to write the log (stdout by default).
+        capacity -- Most records queued before the oldest are dropped.
+        interval -- Seconds between writes.
+        dropped -- Number of records dropped because the queue was full.
+
+        """
+        logging.Handler.__init__(self)
+        self.stream = sys.stdout if stream is None else stream
+        self.records = deque(maxlen=capacity)
+        self.interval = interval
+        self.dropped = 0
+        self._writing = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._drain, name="LogWriter")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def emit(self, record):
+        records = self.records
+        if len(records) == records.maxlen:
+            self.dropped += 1
+        records.append(record)
+
+    def flush(self):
+        """Write everything queued so far (on the calling thread)."""
+        records = self.records
+        with self._writing:
+            lines = []
+            while records:
+                try:
+                    lines.append(self.format(records.popleft()))
+                except IndexError:
+                    break
+                except Exception:
+                    lines.append("<unformattable log record>")
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except Exception:
+                    pass
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        logging.Handler.close(self)
+
+    def _drain(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            self.flush()
+
+_handler = None
+
+def startLogging(level=LOG_LEVEL, stream=None):
+    '''Send log messages at level and above to stream (stdout by default),
+    buffered and written by a background thread. Safe to call more than once.'''
+    global _handler
+    log.setLevel(level)
+    if _handler is None:
+        _handler = BufferedHandler(stream)
+        _handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(_handler)
+        atexit.register(_handler.close)
+    return _handler
@@ -9,17 +9,30 @@ No copyright claimed - do anything you want with this code.
 from __future__ import print_function
 from __future__ import division
 
-import sys, time, base64, traceback, threading
+import sys, time, base64, traceback, threading, atexit
 from xml.etree import ElementTree as ET
 
-import tcpClient, myPlayerBrain, api
-from debug import trap, printrap, bugprint
+import tcpClient, myPlayerBrain, api, instrument, profiler, reconnect, orders, metrics
+import simpleAStar, gcControl, setupPipeline
+import debug
+from debug import trap, printrap, bugprint, log
+from api.path import Path
+
+try:
+    raw_input
+except NameError: # Python 3
+    raw_input = input
 
 DEFAULT_ADDRESS = "127.0.0.1" #local machine
+TURN_WARNING = 0.8 # seconds - a turn this long is flagged
+TURN_DANGER = 1.2 # seconds - a turn this long is close to missing the tick
 
 
 class Framework(object):
     def __init__(self, args):
+        # the setup tables' process pool starts from a forkserver - start it
+        # now, before we have threads (see setupPipeline.py)
+        setupPipeline.warmUp()
         if len(args) >= 2:
             self._brain = myPlayerBrain.MyPlayerBrain(args[1])
         else:
@@ -31,26 +44,69 @@ class Framework(object):
         # Player/Passenger lists, sending back multiple orders, etc.
         self.lock = threading.Lock()
 
+        # called with the api.units.ChangeSet of every status message, before
+        # the brain is given the status. The brain subscribes if it wants it.
+        self.changeListeners = []
+        if hasattr(self._brain, 'statusChanged'):
+            self.addChangeListener(self._brain.statusChanged)
+
+        # opt-in capture of the profile for turns over budget
+        self.profiler = profiler.fromEnvironment(TURN_WARNING)
+        if self.profiler is not None:
+            print("Saving profiles of turns over %.3f seconds to %r" %
+                  (self.profiler.threshold, self.profiler.directory))
+
+        # reconnects on its own thread when the connection drops. Once the
+        # server confirms us again (resuming) the last orders are resent.
+        self.reconnector = reconnect.Reconnector(self._reconnect)
+        self.resuming = False
+
+        # path searches made by the last status's turn (for metrics)
+        self.turnSearches = 0
+        self.turnExpansions = 0
+        self.client = None
+        self._registerGauges()
+
         print("Connecting to server '%s' for user: %r, school: %r" %
               (self.ipAddress, self._brain.name, myPlayerBrain.SCHOOL))
 
+    def addChangeListener(self, listener):
+        """Call listener(changes) with what each status message changed."""
+        self.changeListeners.append(listener)
+
     def _run(self):
         print("starting...")
 
+        # console logging is buffered and written by a background thread so a
+        # slow terminal does not slow down our turns
+        debug.startLogging()
+
+        # dump the per-phase turn timings when we exit
+        if instrument.ENABLED:
+            atexit.register(instrument.dump)
+            atexit.register(lambda: print(orders.stats.report()))
+
+        # opt-in live metrics (WINDWARD_METRICS_PORT / WINDWARD_METRICS_SOCKET)
+        metrics.fromEnvironment()
+
         self.client = tcpClient.TcpClient(self.ipAddress, self)
         self.client.start()
         self._connectToServer()
 
         #It's all messages to us now.
-        print('enter "exit" to exit program')
+        print('enter "exit" to exit program, "stats" for turn timings')
         try:
             while True:
                 line = raw_input()
                 if line == 'exit':
                     break
+                if line == 'stats':
+                    instrument.dump()
+                    print(orders.stats.report())
         except EOFError:
             self.client.close() # exit on EOF
         finally:
+            self.reconnector.close()
             self.client.close()
 
     def statusMessage(self, message):
@@ -58,15 +114,38 @@ class Framework(object):
         print(message)
 
     def incomingMessage(self, message):
+        # no automatic garbage collection during a turn - see gcControl.py
+        with gcControl.turn():
+            turnProfiler = self.profiler
+            if turnProfiler is None:
+                self._incomingMessage(message)
+                return
+            # end() however the turn ends - dropped, failed or exit - so the
+            # sampler or cProfile never runs on into later turns
+            startTime = instrument.wallClock()
+            turnProfiler.begin()
+            try:
+                self._incomingMessage(message)
+            finally:
+                turnProfiler.end(instrument.wallClock() - startTime, message, self._brain)
+
+    def _incomingMessage(self, message):
         try:
-            startTime = time.clock()
+            startTime = instrument.wallClock()
+            startCpu = instrument.cpuClock()
             # get the XML - we assume we always get a valid message from the server.
-            xml = ET.XML(message)
+            with instrument.span('parse'):
+                xml = ET.XML(message)
+
+            resumed = self.resuming and self._resume(xml)
 
             name = xml.tag
-            if name == 'setup':
-                print ("Received setup message")
-                #TODO: logging
+            if name == 'setup' and resumed:
+                # the same game we were in - what we know is only a few
+                # ticks out of date and the next status brings it up to date.
+                log.info("Received setup message - resuming our game")
+            elif name == 'setup':
+                log.info("Received setup message")
                 players = api.units.playersFromXml(xml.find("players"))
                 companies = api.map.companiesFromXml(xml.find("companies"))
                 passengers = api.units.passengersFromXml(xml.find("passengers"), companies)
@@ -75,6 +154,8 @@ class Framework(object):
                 me2 = [p for p in players if p.guid == self.guid][0]
 
                 self._brain.setup(map, me2, players, companies, passengers, self.client)
+                # what setup made lasts the game - keep it out of collections
+                gcControl.freeze()
 
                 ###self.client.sendMessage(ET.tostring(doc))
             elif name == 'status':
@@ -82,6 +163,7 @@ class Framework(object):
                 # the re-send of setup
                 if self.guid is None or len(self.guid) == 0:
                     trap()
+                    instrument.count('messages.dropped')
                     return
 
                 status = xml.attrib["status"]
@@ -92,35 +174,45 @@ class Framework(object):
 
                 if self.lock.acquire(False):
                     try:
-                        api.units.updatePlayersFromXml(brain.players,
-                                                       brain.passengers,
-                                                       xml.find("players"))
-                        api.units.updatePassengersFromXml(brain.passengers,
-                                                          brain.companies,
-                                                          xml.find("passengers"))
-                        # update my path & pick-up
+                        changes = api.units.ChangeSet()
+                        with instrument.span('updatePlayers'):
+                            api.units.updatePlayersFromXml(brain.players,
+                                                           brain.passengers,
+                                                           xml.find("players"),
+                                                           changes)
+                        with instrument.span('updatePassengers'):
+                            api.units.updatePassengersFromXml(brain.passengers,
+                                                              brain.companies,
+                                                              xml.find("passengers"),
+                                                              changes)
+                        for listener in self.changeListeners:
+                            listener(changes)
+                        # update my path & pick-up. No element means none -
+                        # these are what orders.isRedundant compares new orders with.
                         playerStatus = [p for p in brain.players
                                         if p.guid == guid][0]
                         elem = xml.find("path")
                         #bugprint('framework.py: path element ->', ET.tostring(elem))
                         if elem is not None and elem.text is not None:
-                            path = [item.strip() for item in elem.text.split(';')
-                                    if len(item.strip()) > 0]
-                            del playerStatus.limo.path[:]
-                            for stepOn in path:
-                                pos = stepOn.index(',')
-                                playerStatus.limo.path.append( (int(stepOn[:pos]),
-                                                                int(stepOn[pos+1:])) )
+                            playerStatus.limo.path = Path.parse(elem.text)
+                        else:
+                            playerStatus.limo.path = Path()
 
                         elem = xml.find("pick-up")
                         #bugprint('framework.py: pick-up element ->', ET.tostring(elem))
+                        playerStatus.pickup = []
                         if elem is not None and elem.text is not None:
                             names = [item.strip() for item in elem.text.split(';')
                                      if len(item) > 0]
                             playerStatus.pickup = [p for p in brain.passengers if p.name in names]
 
                         # pass in to generate new orders
-                        brain.gameStatus(status, playerStatus, brain.players, brain.passengers)
+                        searches, expansions = simpleAStar.searches, simpleAStar.expansions
+                        with instrument.span('brain'):
+                            brain.gameStatus(status, playerStatus, brain.players, brain.passengers)
+                        self.turnSearches = simpleAStar.searches - searches
+                        self.turnExpansions = simpleAStar.expansions - expansions
+                        instrument.count('turns')
                     #except Exception as e:
                     #    raise e
                     finally:
@@ -128,42 +220,100 @@ class Framework(object):
                 else:
                     # failed to acquire the lock - we're throwing this message away.
                     trap()
+                    instrument.count('messages.dropped')
                     return
             elif name == 'exit':
-                print("Received exit message")
-                #TODO: logging
+                log.info("Received exit message")
                 sys.exit(0)
             else:
                 printrap("ERROR: bad message (XML) from server - root node %r" % name)
 
-            turnTime = time.clock() - startTime
-            prefix = '' if turnTime < 0.8 else "WARNING - "
-            prefix = "!DANGER! - " if turnTime >= 1.2 else prefix
-            print(prefix + "turn took %r seconds" % turnTime)
-            #TODO: logging
+            turnTime = instrument.wallClock() - startTime
+            instrument.record('turn', turnTime, instrument.cpuClock() - startCpu)
+            if turnTime < TURN_WARNING:
+                log.info("turn took %r seconds", turnTime)
+            elif turnTime < TURN_DANGER:
+                log.warning("WARNING - turn took %r seconds", turnTime)
+            else:
+                log.error("!DANGER! - turn took %r seconds", turnTime)
         except Exception as e:
             traceback.print_exc()
             printrap("Error on incoming message.  Exception: %r" % e)
 
-    def connectionLost(self, exception):
-        print("Lost our connection! Exception: %r" % exception)
-        client = self.client
+    def _registerGauges(self):
+        """What metrics reports besides instrument's histograms and counters.
+        Each is read on the metrics thread, so only reads values."""
+        gauge = instrument.gauge
+        gauge('receive.queueDepth',
+              lambda: len(getattr(getattr(self.client, 'receiver', None), 'input', ())))
+        gauge('reconnect.outages', lambda: self.reconnector.outages)
+        gauge('reconnect.failures', lambda: self.reconnector.failures)
+        gauge('reconnect.coalesced', lambda: self.reconnector.coalesced)
+        gauge('orders.sent', lambda: orders.stats.sent)
+        gauge('orders.suppressed', lambda: orders.stats.suppressed)
+        gauge('orders.bytesSent', lambda: orders.stats.bytesSent)
+        gauge('search.total', lambda: simpleAStar.searches)
+        gauge('search.expansions', lambda: simpleAStar.expansions)
+        gauge('search.lastTurn', lambda: self.turnSearches)
+        gauge('search.lastTurnExpansions', lambda: self.turnExpansions)
+        speculation = getattr(self._brain, 'speculation', None)
+        if speculation is not None:
+            for key in speculation:
+                gauge('speculation.' + key, lambda key=key: speculation[key])
 
-        delay = .5
-        while True:
-            try:
-                if client is not None:
-                    client.close()
-                client = self.client = tcpClient.TcpClient(self.ipAddress, self)
-                client.start()
+    def idle(self):
+        """Called by the client while no message is waiting. Gives the brain
+        the time (see MyPlayerBrain.idle), then collects garbage (see
+        gcControl.py). Returns True if there is more to do."""
+        idle = getattr(self._brain, 'idle', None)
+        if not self.lock.acquire(False):
+            return False
+        try:
+            if idle is not None and idle():
+                return True
+            return gcControl.collectIdle()
+        except Exception as e:
+            traceback.print_exc()
+            printrap("Error in idle.  Exception: %r" % e)
+            return False
+        finally:
+            self.lock.release()
 
-                self._connectToServer()
-                print("Re-connected")
-                return
-            except Exception as e:
-                print("Re-connection failed! Exception: %r" % e) # fix this
-                time.sleep(delay)
-                delay += .5
+    def connectionLost(self, exception, client=None):
+        if client is not None and client is not self.client:
+            return # an old connection we have already replaced
+        log.warning("Lost our connection! Exception: %r", exception)
+        self.reconnector.lost(exception)
+
+    def _reconnect(self):
+        """One attempt to connect and join again (on the Reconnector's thread)."""
+        old = self.client
+        client = tcpClient.TcpClient(self.ipAddress, self)
+        if old is not None:
+            old.close()
+            client.lastMessage = old.lastMessage
+        self.client = self._brain.client = client
+        self.resuming = True
+        client.start()
+        self._connectToServer()
+
+    def _resume(self, xml):
+        """First message on a new connection: the server has us again. If it
+        is the same game, answer a setup with ready (and our current path and
+        pickup), or after a status resend our last orders. Returns True if it
+        is the same game."""
+        self.resuming = False
+        sameGame = self.guid is not None and (xml.tag != 'setup' or
+                                              xml.attrib.get("my-guid") == self.guid)
+        lastMessage = self.client.lastMessage
+        if sameGame and xml.tag == 'setup':
+            # the server waits for ready after a setup, whatever we sent last
+            me = self._brain.me
+            sendOrders(self._brain, "ready", me.limo.path, me.pickup)
+        elif sameGame and lastMessage is not None:
+            self.client.sendMessage(lastMessage)
+        self.reconnector.resumed()
+        return sameGame
 
     def _connectToServer(self):
         root = ET.Element('join', {'name':     self._brain.name,
@@ -172,26 +322,18 @@ class Framework(object):
         avatar = self._brain.avatar
         if avatar is not None:
             av_el = ET.Element('avatar')
-            av_el.text = base64.b64encode(avatar)
+            av_el.text = base64.b64encode(avatar).decode('ascii')
             root.append(av_el)
-        self.client.sendMessage(ET.tostring(root))
+        self.client.sendMessage(ET.tostring(root), remember=False)
 
+@instrument.timed('sendOrders')
 def sendOrders(brain, order, path, pickup):
     """Used to communicate with the server. Do not change this method!"""
-    xml = ET.Element(order)
     if len(path) > 0:
         brain.me.limo.path = path # update our saved Player to match new settings
-        sb = [str(point[0]) + ',' + str(point[1]) + ';' for point in path]
-        elem = ET.Element('path')
-        elem.text = ''.join(sb)
-        xml.append(elem)
     if len(pickup) > 0:
         brain.me.pickup = pickup # update our saved Player to match new settings
-        sb = [psngr.name + ';' for psngr in pickup]
-        elem = ET.Element('pick-up')
-        elem.text = ''.join(sb)
-        xml.append(elem)
-    brain.client.sendMessage(ET.tostring(xml))
+    brain.client.sendMessage(orders.formatOrders(order, path, pickup))
 
 if __name__ == '__main__':
     printrap(sys.argv[0], breakOn=not sys.argv[0].endswith("framework.py"))
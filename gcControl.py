@@ -0,0 +1,142 @@
+"""
+Module gcControl: keeps the cyclic garbage collector out of our turns.
+
+The cyclic collector runs whenever enough container objects have been
+allocated - which during a turn (an ElementTree per status, a node per tile
+searched, lists in allPickups) is often, and a full collection of
+everything the game holds can take milliseconds. So:
+
+    freeze() -- after setup: collect once, then move every object alive into
+        the permanent generation (gc.freeze, Python 3.7+) so later
+        collections never look at the map, the players and so on again.
+    with turn(): -- around each message. Automatic collection is switched
+        off for the turn and back on (if it was on) after it; a turn only
+        collects if garbage has piled up past FORCE_AT objects, which only
+        happens with no idle time at all.
+    collectIdle() -- between messages (Framework.idle): collect the oldest
+        generation that is over its threshold, as the collector itself
+        would have. True if it did - call again while it is. Optional:
+        without it the collector, on again between turns, does the same
+        the next time something allocates.
+
+Reported through instrument:
+    gcPause -- every collection (via gc.callbacks, Python 3.3+; on Python 2
+        only the collections made here).
+    turnGc -- the time spent collecting during each turn (0 for most).
+    counters gc.idle, gc.inTurn and gc.forced -- collections run between
+        turns, collections during turns, and how many of those were forced
+        at the end of a turn.
+
+Set ENABLED = False (or WINDWARD_GC_CONTROL=0) to leave the collector alone
+and only measure it.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os, gc
+
+import instrument
+
+ENABLED = os.environ.get("WINDWARD_GC_CONTROL", "1") != "0"
+FORCE_AT = 20000
+"""Uncollected allocations at the end of a turn that force a collection."""
+
+_started = None
+_inTurn = False
+_turnPause = 0.0
+_wasEnabled = False
+_installed = False
+
+
+def _onGc(phase, info):
+    global _started, _turnPause
+    if phase == "start":
+        _started = instrument.wallClock()
+    elif _started is not None:
+        pause = instrument.wallClock() - _started
+        _started = None
+        instrument.record('gcPause', pause)
+        if _inTurn:
+            _turnPause += pause
+            instrument.count('gc.inTurn')
+
+def install():
+    """Start timing collections (done by the other functions if needed)."""
+    global _installed
+    if not _installed:
+        _installed = True
+        callbacks = getattr(gc, 'callbacks', None)
+        if callbacks is not None:
+            callbacks.append(_onGc)
+
+def _collect(generation):
+    """Collect generation, timing it ourselves if gc.callbacks cannot."""
+    global _turnPause
+    if getattr(gc, 'callbacks', None) is not None:
+        gc.collect(generation)
+        return
+    start = instrument.wallClock()
+    gc.collect(generation)
+    pause = instrument.wallClock() - start
+    instrument.record('gcPause', pause)
+    if _inTurn:
+        _turnPause += pause
+        instrument.count('gc.inTurn')
+
+def freeze():
+    """Collect, then exempt everything alive now from later collections.
+    Anything frozen before (a previous game in this process) is unfrozen
+    first, so it can still be collected."""
+    install()
+    if hasattr(gc, 'unfreeze'):
+        gc.unfreeze()
+    _collect(2)
+    if ENABLED and hasattr(gc, 'freeze'):
+        gc.freeze()
+
+def collectIdle():
+    """Collect the oldest generation that is over its threshold. Returns
+    True if there was one (there may be more to do)."""
+    if not ENABLED or _inTurn:
+        return False
+    counts = gc.get_count()
+    thresholds = gc.get_threshold()
+    for generation in (2, 1, 0):
+        if thresholds[generation] and counts[generation] > thresholds[generation]:
+            _collect(generation)
+            instrument.count('gc.idle')
+            return True
+    return False
+
+
+class _Turn(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        global _inTurn, _turnPause, _wasEnabled
+        install()
+        _wasEnabled = ENABLED and gc.isenabled()
+        if _wasEnabled:
+            gc.disable()
+        _inTurn = True
+        _turnPause = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        global _inTurn
+        if ENABLED and gc.get_count()[0] > FORCE_AT:
+            _collect(0)
+            instrument.count('gc.forced')
+        _inTurn = False
+        if _wasEnabled:
+            gc.enable()
+        instrument.record('turnGc', _turnPause)
+        return False
+
+_TURN = _Turn()
+
+def turn():
+    """The enclosed block is a turn (see the module docstring)."""
+    return _TURN
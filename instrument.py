@@ -0,0 +1,235 @@
+"""
+Module instrument: low-overhead timing of the phases of a turn.
+
+span(name) -- context manager that times a block into the histogram "name".
+record(name, wall, cpu) -- add one measurement (in seconds) to a histogram.
+count(name, n) -- add n to the counter name.
+gauge(name, read) -- register read(), called for the value of name whenever
+    a snapshot is taken (for values something else already keeps).
+snapshot() -- a copy of every histogram, counter and gauge (see metrics.py).
+report() -- a printable table of every histogram recorded so far.
+dump(out) -- write report() to out (stdout by default).
+reset() -- throw away everything recorded so far.
+
+Every span records both wall-clock time and CPU time of the process, so time
+spent blocked (on the lock, the socket, the GIL) shows up as the difference
+between the two. Measurements go into fixed power-of-two buckets so recording
+is a handful of integer operations and memory does not grow with the number of
+turns. Set ENABLED = False (or the environment variable WINDWARD_INSTRUMENT=0)
+to make span() return a shared do-nothing object.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os, sys, time, threading
+
+ENABLED = os.environ.get("WINDWARD_INSTRUMENT", "1") != "0"
+
+# Buckets are powers of two in microseconds: bucket i holds values in
+# [2**(i-1), 2**i) us. 28 buckets covers 1us up to ~134 seconds.
+BUCKETS = 28
+
+wallClock = getattr(time, 'perf_counter', time.time)
+"""Highest resolution wall clock available (seconds)."""
+
+if hasattr(time, 'process_time'):
+    cpuClock = time.process_time
+elif sys.platform.startswith('win'):
+    # time.clock() is wall time on Windows - os.times() is the only CPU clock.
+    def cpuClock():
+        t = os.times()
+        return t[0] + t[1]
+else:
+    cpuClock = time.clock
+"""CPU time used by this process (seconds)."""
+
+
+class Histogram(object):
+    """Fixed-size log2 histogram of durations, with count/total/min/max."""
+
+    __slots__ = ('name', 'count', 'total', 'cpuTotal', 'minimum', 'maximum',
+                 'buckets')
+
+    def __init__(self, name):
+        """name -- The phase this histogram measures.
+        count -- Number of measurements.
+        total -- Sum of all wall-clock measurements (seconds).
+        cpuTotal -- Sum of all CPU time measurements (seconds).
+        minimum, maximum -- Extremes of the wall-clock measurements (seconds).
+        buckets -- Counts of wall-clock measurements per power-of-two bucket.
+
+        """
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.cpuTotal = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, wall, cpu=0.0):
+        self.count += 1
+        self.total += wall
+        self.cpuTotal += cpu
+        if self.minimum is None or wall < self.minimum:
+            self.minimum = wall
+        if wall > self.maximum:
+            self.maximum = wall
+        index = int(wall * 1000000).bit_length()
+        self.buckets[index if index < BUCKETS else BUCKETS - 1] += 1
+
+    def percentile(self, fraction):
+        """Upper bound (seconds) of the bucket holding the given fraction."""
+        if self.count == 0:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= wanted:
+                return min((1 << index) / 1000000, self.maximum)
+        return self.maximum
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def cpuMean(self):
+        return self.cpuTotal / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return ("Histogram<%s: n=%d, mean=%.6f, cpu=%.6f, max=%.6f>" %
+                (self.name, self.count, self.mean(), self.cpuMean(), self.maximum))
+
+
+# name -> Histogram. Only ever added to, so readers never need the lock.
+histograms = {}
+_lock = threading.Lock()
+
+def histogram(name):
+    """Return the histogram for name, creating it the first time."""
+    hist = histograms.get(name)
+    if hist is None:
+        with _lock:
+            hist = histograms.get(name)
+            if hist is None:
+                hist = histograms[name] = Histogram(name)
+    return hist
+
+def record(name, wall, cpu=0.0):
+    """Add a measurement (seconds) to the histogram name."""
+    if ENABLED:
+        histogram(name).add(wall, cpu)
+
+
+class _Span(object):
+    __slots__ = ('hist', 'wall', 'cpu')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.cpu = cpuClock()
+        self.wall = wallClock()
+        return self
+
+    def __exit__(self, *exc):
+        wall = wallClock() - self.wall
+        self.hist.add(wall, cpuClock() - self.cpu)
+        return False
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name):
+    """Time the enclosed block into the histogram name.
+
+    with instrument.span('parse'):
+        xml = ET.XML(message)
+
+    """
+    if not ENABLED:
+        return _NO_SPAN
+    return _Span(histogram(name))
+
+def timed(name):
+    """Decorator - time every call of the function into the histogram name."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        hist = histogram(name)
+        def wrapper(*args, **kwargs):
+            cpu = cpuClock()
+            wall = wallClock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.add(wallClock() - wall, cpuClock() - cpu)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorate
+
+
+def report():
+    """Return a table of all histograms, times in milliseconds."""
+    lines = ["%-18s %8s %9s %9s %9s %9s %9s %9s" %
+             ("phase", "count", "mean", "cpu", "p50", "p90", "p99", "max")]
+    for name in sorted(histograms):
+        hist = histograms[name]
+        lines.append("%-18s %8d %9.3f %9.3f %9.3f %9.3f %9.3f %9.3f" %
+                     (name, hist.count, hist.mean() * 1000, hist.cpuMean() * 1000,
+                      hist.percentile(.5) * 1000, hist.percentile(.9) * 1000,
+                      hist.percentile(.99) * 1000, hist.maximum * 1000))
+    return '\n'.join(lines)
+
+def dump(out=None):
+    """Write the report to out (default stdout)."""
+    out = sys.stdout if out is None else out
+    print(report(), file=out)
+
+
+# name -> int. Written by the dispatch thread; readers take a copy.
+counters = {}
+# name -> function returning the current value.
+gauges = {}
+
+def count(name, n=1):
+    """Add n to the counter name."""
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + n
+
+def gauge(name, read):
+    """Report read() as the value of name in every snapshot."""
+    gauges[name] = read
+
+def snapshot():
+    """Return {"histograms": {name: {count, sum, cpuSum, max, buckets}},
+    "counters": {name: n}, "gauges": {name: value}}, copied so the caller can
+    take its time with it. Takes no lock the dispatch thread uses."""
+    hists = {}
+    for name, hist in list(histograms.items()):
+        hists[name] = {"count": hist.count, "sum": hist.total, "cpuSum": hist.cpuTotal,
+                       "max": hist.maximum, "buckets": list(hist.buckets)}
+    values = {}
+    for name, read in list(gauges.items()):
+        try:
+            values[name] = read()
+        except Exception:
+            values[name] = None
+    return {"histograms": hists, "counters": dict(counters), "gauges": values}
+
+def reset():
+    with _lock:
+        histograms.clear()
+        counters.clear()
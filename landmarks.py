@@ -0,0 +1,175 @@
+"""
+Module landmarks: a better distance estimate for path searches (the "ALT"
+landmark heuristic).
+
+Manhattan distance knows nothing about the parks and company blocks between
+two tiles, so it badly underestimates on our maps. Instead a few landmark
+road tiles are chosen the first time the Map's landmarks are used, and the
+exact distance from each landmark to every tile is stored. For any landmark L the triangle inequality
+gives
+
+    distance(tile, goal) >= |distance(L, goal) - distance(L, tile)|
+
+so the largest of these (and Manhattan distance) is still a lower bound on
+the real distance, and usually a far tighter one.
+
+Landmarks(gmap) -- builds the tables (COUNT landmarks).
+Landmarks.heuristic(goal) -- a function tile -> estimated ticks to goal, to
+    pass to simpleAStar.calculatePath (which uses Manhattan distance unless
+    given one).
+Landmarks.indexHeuristic(goal) -- the same for tile indexes x * height + y,
+    for weightedPath.
+
+Landmarks are picked farthest-first: each new one is the road tile farthest
+from all the ones picked so far, which spreads them around the edges of the
+map where they give the best bounds. Each landmark's table is an array of
+2-byte ints, one per tile (see bytesPerLandmark). The tables are shared with
+other bots on the same map (see sharedTables.py).
+
+driveableGrid and distancesFrom are the breadth-first search the tables are
+made with (setupPipeline uses them too).
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+from array import array
+from collections import deque
+
+import instrument, sharedTables
+from debug import log
+
+COUNT = 8
+"""Number of landmarks per map. 0 to not build any."""
+UNREACHABLE = -1
+"""Distance to a tile there is no way to."""
+TYPECODE = 'h'
+"""Distances are signed 16-bit ticks."""
+
+
+def driveableGrid(gmap):
+    """A bytearray with 1 for each driveable tile, indexed x * height + y."""
+    grid = bytearray(gmap.width * gmap.height)
+    height = gmap.height
+    for x, column in enumerate(gmap.squares):
+        for y, square in enumerate(column):
+            if square is not None and square.isDriveable():
+                grid[x * height + y] = 1
+    return grid
+
+def distancesFrom(grid, width, height, start):
+    """Breadth-first search from tile index start over grid. Returns an array
+    of the ticks to every tile (UNREACHABLE where there is no way)."""
+    size = width * height
+    distances = array(TYPECODE, [UNREACHABLE]) * size
+    distances[start] = 0
+    frontier = deque([start])
+    popleft, append = frontier.popleft, frontier.append
+    while frontier:
+        tile = popleft()
+        ticks = distances[tile] + 1
+        y = tile % height
+        for neighbor in (tile - height, tile + height,
+                         tile - 1 if y > 0 else -1,
+                         tile + 1 if y < height - 1 else -1):
+            if (0 <= neighbor < size and grid[neighbor] and
+                distances[neighbor] == UNREACHABLE):
+                distances[neighbor] = ticks
+                append(neighbor)
+    return distances
+
+
+class Landmarks(object):
+    """Exact distances from a few landmark tiles to every tile of a map."""
+
+    def __init__(self, gmap, count=COUNT):
+        """gmap -- The map (squares, width and height are used).
+        count -- Number of landmarks to pick.
+        tiles -- The landmark tiles, (x, y).
+        tables -- One array per landmark: ticks from it to each tile,
+            indexed x * height + y. (A read-only memoryview if shared.)
+        bytesPerLandmark -- Memory used by each table.
+
+        """
+        start = instrument.wallClock()
+        self.width = width = gmap.width
+        self.height = height = gmap.height
+        grid = getattr(gmap, 'grid', None) or driveableGrid(gmap)
+        self.tiles = []
+        self.tables = []
+        size = width * height
+        key = sharedTables.tableKey("landmarks", grid, width, height, count)
+        shared = sharedTables.attach(key)
+        if shared is not None:
+            # another bot on this map has made them
+            header, tables = shared
+            self.tiles = list(zip(header[0::2], header[1::2]))
+            self.tables = [tables[n * size:(n + 1) * size] for n in range(len(self.tiles))]
+        roads = [i for i in range(size) if grid[i]] if shared is None else None
+        if roads:
+            # farthest-first: start from the road tile farthest from any one
+            nearest = distancesFrom(grid, width, height, roads[0])
+            for n in range(count):
+                best = max(roads, key=nearest.__getitem__)
+                if n > 0 and nearest[best] <= 0:
+                    break # every road tile is a landmark or unreachable
+                table = distancesFrom(grid, width, height, best)
+                self.tiles.append((best // height, best % height))
+                self.tables.append(table)
+                if n == 0:
+                    nearest = table
+                else:
+                    nearest = array(TYPECODE, [min(a, b) if b >= 0 else a
+                                               for a, b in zip(nearest, table)])
+            allTables = array(TYPECODE)
+            for table in self.tables:
+                allTables.extend(table)
+            sharedTables.publish(key, [n for tile in self.tiles for n in tile], allTables)
+        self.bytesPerLandmark = width * height * array(TYPECODE).itemsize
+        instrument.record('landmarks', instrument.wallClock() - start)
+        log.info("%d landmarks in %.3f seconds, %d bytes each (%d total%s)",
+                 len(self.tables), instrument.wallClock() - start,
+                 self.bytesPerLandmark, self.bytesPerLandmark * len(self.tables),
+                 ", shared" if shared is not None else "")
+
+    def __len__(self):
+        return len(self.tables)
+
+    def heuristic(self, goal):
+        """Return estimate(tile): a lower bound on the ticks from tile to goal."""
+        height = self.height
+        index = goal[0] * height + goal[1]
+        toGoal = [(table, table[index]) for table in self.tables if table[index] >= 0]
+        gx, gy = goal
+
+        def estimate(tile):
+            best = abs(tile[0] - gx) + abs(tile[1] - gy)
+            i = tile[0] * height + tile[1]
+            for table, goalTicks in toGoal:
+                ticks = table[i]
+                if ticks >= 0:
+                    bound = goalTicks - ticks if goalTicks > ticks else ticks - goalTicks
+                    if bound > best:
+                        best = bound
+            return best
+        return estimate
+
+    def indexHeuristic(self, goal):
+        """heuristic(goal), for tiles given as indexes x * height + y."""
+        height = self.height
+        index = goal[0] * height + goal[1]
+        toGoal = [(table, table[index]) for table in self.tables if table[index] >= 0]
+        gx, gy = goal
+
+        def estimate(i):
+            x, y = divmod(i, height)
+            best = abs(x - gx) + abs(y - gy)
+            for table, goalTicks in toGoal:
+                ticks = table[i]
+                if ticks >= 0:
+                    bound = goalTicks - ticks if goalTicks > ticks else ticks - goalTicks
+                    if bound > best:
+                        best = bound
+            return best
+        return estimate
@@ -0,0 +1,436 @@
+"""
+Module localServer: a local stand-in for the game server, for running bots
+without the real server (see tournament.py).
+
+generateSetup(seed, names) -- make a random city map, companies, passengers
+    and players, as the <setup> XML the server sends.
+Game -- the rules: moves limos along their paths and applies pick-up,
+    delivery and refusal at bus stops. Works on the api objects.
+LocalServer -- plays a Game with a set of Frameworks, talking to them with
+    the same XML messages as the real server (but in-process, no sockets).
+
+The rules are a simplification of the real game: a limo moves one tile per
+tick, a passenger is picked up at a bus stop if they are first on the limo's
+pick-up list, and refuses to get out if one of their enemies is waiting in
+the destination lobby. After delivery a passenger waits in that lobby for the
+next company on their route.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import random
+from xml.etree import ElementTree as ET
+
+from api import map, units
+from api.path import Path
+import instrument
+
+UPDATE_TICKS = 10
+"""Ticks between UPDATE status messages."""
+STEPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+"""One tile north, east, south and west."""
+ANGLES = dict(zip(STEPS, (0, 90, 180, 270)))
+"""Limo angle when moving in each direction (0 is North)."""
+
+
+def roadDirection(north, east, south, west):
+    """Return the DIRECTION name for a road with the given neighbours."""
+    sides = (north, east, south, west)
+    count = sum(1 for s in sides if s)
+    if count == 4:
+        return "INTERSECTION"
+    if count == 3:
+        return ("T_SOUTH", "T_WEST", "T_NORTH", "T_EAST")[sides.index(False)]
+    if count == 2:
+        if north and south:
+            return "NORTH_SOUTH"
+        if east and west:
+            return "EAST_WEST"
+        return "CURVE_" + ("N" if north else "S") + ("E" if east else "W")
+    # a dead end is named for the side it is closed on.
+    if north:
+        return "SOUTH_UTURN"
+    if south:
+        return "NORTH_UTURN"
+    if east:
+        return "WEST_UTURN"
+    return "EAST_UTURN"
+
+def generateSetup(seed, names, width=48, height=36, blockWidth=7, blockHeight=5,
+                  numCompanies=12, numPassengers=40, gaps=.12):
+    """Return a random <setup> element (without my-guid) for the players names.
+
+    The city is a grid of roads around blocks of blockWidth x blockHeight, with
+    a fraction gaps of the road segments removed (keeping all roads
+    connected) so there are dead ends and detours.
+    """
+    rand = random.Random(seed)
+    road = set()
+    for x in range(1, width - 1):
+        for y in range(1, height - 1):
+            if x % (blockWidth + 1) == 1 or y % (blockHeight + 1) == 1:
+                road.add((x, y))
+    # knock out some stretches of road between intersections
+    segments = {}
+    for (x, y) in road:
+        horizontal = (y % (blockHeight + 1) == 1)
+        vertical = (x % (blockWidth + 1) == 1)
+        if horizontal and not vertical:
+            segments.setdefault(('h', x // (blockWidth + 1), y), []).append((x, y))
+        elif vertical and not horizontal:
+            segments.setdefault(('v', x, y // (blockHeight + 1)), []).append((x, y))
+    keys = sorted(segments)
+    keys = _sample(rand, keys, len(keys))
+    for key in keys[:int(len(keys) * gaps)]:
+        removed = set(segments[key])
+        if _connected(road - removed):
+            road -= removed
+    road = _largestComponent(road)
+
+    # companies - a bus stop on a straight road next to a block
+    def isRoad(x, y):
+        return (x, y) in road
+    candidates = sorted(t for t in road
+                        if sum(1 for dx, dy in STEPS if isRoad(t[0] + dx, t[1] + dy)) == 2 and
+                        (isRoad(t[0], t[1] - 1) and isRoad(t[0], t[1] + 1) or
+                         isRoad(t[0] - 1, t[1]) and isRoad(t[0] + 1, t[1])))
+    stops = []
+    for tile in _sample(rand, candidates, min(numCompanies, len(candidates))):
+        if all(abs(tile[0] - s[0]) + abs(tile[1] - s[1]) > 2 for s in stops):
+            stops.append(tile)
+    buildings = {}
+    for stop in stops:
+        for dx, dy in STEPS:
+            tile = (stop[0] + dx, stop[1] + dy)
+            if tile not in road and 0 <= tile[0] < width and 0 <= tile[1] < height:
+                buildings[tile] = stop
+                break
+
+    root = ET.Element('setup')
+    playersElem = ET.SubElement(root, 'players')
+    starts = _sample(rand, sorted(road - set(stops)), len(names))
+    for index, name in enumerate(names):
+        ET.SubElement(playersElem, 'player',
+                      {'guid': 'guid-%d' % index, 'name': name,
+                       'limo-x': str(starts[index][0]), 'limo-y': str(starts[index][1]),
+                       'limo-angle': '0'})
+    companyNames = ["Company%02d" % i for i in range(len(stops))]
+    companiesElem = ET.SubElement(root, 'companies')
+    for name, stop in zip(companyNames, stops):
+        ET.SubElement(companiesElem, 'company',
+                      {'name': name, 'bus-stop-x': str(stop[0]), 'bus-stop-y': str(stop[1])})
+    passengerNames = ["Passenger%02d" % i for i in range(numPassengers)]
+    passengersElem = ET.SubElement(root, 'passengers')
+    for name in passengerNames:
+        route = _sample(rand, companyNames, _randint(rand, 2, 4))
+        psgr = ET.SubElement(passengersElem, 'passenger',
+                             {'name': name, 'points-delivered': str(_randint(rand, 1, 5)),
+                              'lobby': route[0], 'destination': route[1]})
+        for company in route[2:]:
+            ET.SubElement(psgr, 'route').text = company
+        for enemy in _sample(rand, passengerNames, _randint(rand, 0, 2)):
+            if enemy != name:
+                ET.SubElement(psgr, 'enemy').text = enemy
+
+    mapElem = ET.SubElement(root, 'map', {'width': str(width), 'height': str(height),
+                                          'units-tile': '24'})
+    for x in range(width):
+        for y in range(height):
+            attrs = {'x': str(x), 'y': str(y)}
+            if (x, y) in road:
+                n, e, s, w = (isRoad(x, y - 1), isRoad(x + 1, y),
+                              isRoad(x, y + 1), isRoad(x - 1, y))
+                attrs['type'] = 'BUS_STOP' if (x, y) in stops else 'ROAD'
+                attrs['direction'] = roadDirection(n, e, s, w)
+                if n + e + s + w >= 3:
+                    if rand.random() < .3:
+                        attrs['signal'] = 'true'
+                    elif rand.random() < .5:
+                        signs = [sign for sign, side in (("STOP_NORTH", n), ("STOP_EAST", e),
+                                                         ("STOP_SOUTH", s), ("STOP_WEST", w))
+                                 if side and rand.random() < .5]
+                        if signs:
+                            attrs['stop-sign'] = ','.join(signs)
+            else:
+                attrs['type'] = 'COMPANY' if (x, y) in buildings else 'PARK'
+            ET.SubElement(mapElem, 'tile', attrs)
+    return root
+
+# random.randint/sample/shuffle give different results on Python 2 and 3 for
+# the same seed; random() does not. Built on random() the same seed makes the
+# same game on every interpreter, so timings can be compared.
+def _randint(rand, low, high):
+    return low + int(rand.random() * (high - low + 1))
+
+def _sample(rand, population, count):
+    pool = list(population)
+    for i in range(count):
+        j = _randint(rand, i, len(pool) - 1)
+        pool[i], pool[j] = pool[j], pool[i]
+    return pool[:count]
+
+def _neighbours(tile):
+    return [(tile[0] + dx, tile[1] + dy) for dx, dy in STEPS]
+
+def _component(tiles, start):
+    seen = set([start])
+    todo = [start]
+    while todo:
+        for n in _neighbours(todo.pop()):
+            if n in tiles and n not in seen:
+                seen.add(n)
+                todo.append(n)
+    return seen
+
+def _connected(tiles):
+    return not tiles or len(_component(tiles, min(tiles))) == len(tiles)
+
+def _largestComponent(tiles):
+    best = set()
+    left = set(tiles)
+    while left:
+        part = _component(left, min(left))
+        left -= part
+        if len(part) > len(best):
+            best = part
+    return best
+
+
+class Game(object):
+    """The rules, applied to api objects built from a <setup> element."""
+
+    def __init__(self, setup):
+        """setup -- The <setup> element (see generateSetup).
+
+        map, companies, passengers, players -- The game state (api objects).
+        ticks -- Number of ticks played.
+        lastDelivered -- {Player: the last Passenger they delivered}.
+        changes -- An api.units.ChangeSet of what the last tick changed.
+
+        """
+        self.companies = map.companiesFromXml(setup.find("companies"))
+        self.passengers = units.passengersFromXml(setup.find("passengers"), self.companies)
+        self.map = map.Map(setup.find("map"), self.companies)
+        self.players = units.playersFromXml(setup.find("players"))
+        self.ticks = 0
+        self.lastDelivered = {}
+        self.changes = units.ChangeSet()
+        self._noPath = set()
+
+    def setOrders(self, player, path, pickup):
+        """Give player's limo a new path (list of tiles, may start at the
+        limo's tile) and/or pick-up list (list of Passengers)."""
+        limo = player.limo
+        if path:
+            path = Path(path)
+            if path[0] == limo.tilePosition:
+                del path[0]
+            limo.path = path
+            self._noPath.discard(player)
+        if pickup:
+            player.pickup = list(pickup)
+
+    def isOver(self):
+        return all(p.destination is None for p in self.passengers)
+
+    def step(self):
+        """Play one tick. Return the [(status, Player)] that happened."""
+        self.ticks += 1
+        self.changes = units.ChangeSet()
+        events = []
+        for player in self.players:
+            status = self._move(player)
+            if status is not None:
+                events.append((status, player))
+        if self.ticks % UPDATE_TICKS == 0:
+            # limos still waiting on a new path get told again
+            self._noPath.clear()
+            events.extend(("UPDATE", p) for p in self.players)
+        return events
+
+    def _move(self, player):
+        limo = player.limo
+        if not limo.path:
+            if player in self._noPath:
+                return None
+            self._noPath.add(player)
+            return "NO_PATH"
+        pos = limo.tilePosition
+        nxt = limo.path.pop(0)
+        step = (nxt[0] - pos[0], nxt[1] - pos[1])
+        square = self.map.squareOrDefault(nxt)
+        if step not in ANGLES or square is None or not square.isDriveable():
+            # not a legal move - throw the path away
+            del limo.path[:]
+            return None
+        limo.tilePosition = nxt
+        limo.angle = ANGLES[step]
+        self.changes.movedLimos.add(player)
+        company = getattr(square, 'company', None)
+        if company is None:
+            return None
+        return self._atBusStop(player, company)
+
+    def _atBusStop(self, player, company):
+        limo = player.limo
+        changes = self.changes
+        delivered = pickedUp = False
+        passenger = limo.passenger
+        if passenger is not None and passenger.destination == company:
+            if company.wouldRefuse(passenger):
+                return "PASSENGER_REFUSED"
+            player.score += passenger.pointsDelivered
+            player.passengersDelivered.append(passenger)
+            self.lastDelivered[player] = passenger
+            limo.passenger = passenger.car = None
+            if passenger.route:
+                passenger.destination = passenger.route.pop(0)
+                passenger.lobby = company
+                company.arrive(passenger)
+                changes.lobbyChanged.add(passenger)
+                changes.companiesGained.add(company)
+            else:
+                passenger.destination = None
+            changes.scoreChanged.add(player)
+            changes.delivered.add(player)
+            changes.limoPassengerChanged.add(player)
+            changes.carChanged.add(passenger)
+            changes.destinationChanged.add(passenger)
+            delivered = True
+        if limo.passenger is None:
+            for psngr in player.pickup:
+                if psngr in company.passengers:
+                    company.leave(psngr)
+                    psngr.lobby = None
+                    psngr.car = limo
+                    limo.passenger = psngr
+                    player.pickup = [p for p in player.pickup if p is not psngr]
+                    changes.lobbyChanged.add(psngr)
+                    changes.carChanged.add(psngr)
+                    changes.companiesLost.add(company)
+                    changes.limoPassengerChanged.add(player)
+                    pickedUp = True
+                    break
+        if delivered and pickedUp:
+            return "PASSENGER_DELIVERED_AND_PICKED_UP"
+        if delivered:
+            return "PASSENGER_DELIVERED"
+        if pickedUp:
+            return "PASSENGER_PICKED_UP"
+        if len(limo.path) <= 1:
+            # we were headed here and nothing happened
+            return "PASSENGER_NO_ACTION"
+        return None
+
+    def statusXml(self, status, player):
+        """Return the <status> message text about player."""
+        root = ET.Element('status', {'status': status, 'player-guid': player.guid})
+        playersElem = ET.SubElement(root, 'players')
+        for p in self.players:
+            attrs = {'guid': p.guid, 'score': repr(float(p.score)),
+                     'limo-x': str(p.limo.tilePosition[0]),
+                     'limo-y': str(p.limo.tilePosition[1]),
+                     'limo-angle': str(p.limo.angle)}
+            if p.limo.passenger is not None:
+                attrs['passenger'] = p.limo.passenger.name
+            if p in self.lastDelivered:
+                attrs['last-delivered'] = self.lastDelivered[p].name
+            ET.SubElement(playersElem, 'player', attrs)
+        passengersElem = ET.SubElement(root, 'passengers')
+        for psngr in self.passengers:
+            attrs = {'name': psngr.name}
+            if psngr.destination is not None:
+                attrs['destination'] = psngr.destination.name
+            if psngr.lobby is not None:
+                attrs['status'] = 'lobby'
+                attrs['lobby'] = psngr.lobby.name
+            elif psngr.car is not None:
+                attrs['status'] = 'travelling'
+            else:
+                attrs['status'] = 'done'
+            ET.SubElement(passengersElem, 'passenger', attrs)
+        if player.limo.path:
+            ET.SubElement(root, 'path').text = (
+                '%d,%d;' % player.limo.tilePosition + Path(player.limo.path).format())
+        if player.pickup:
+            ET.SubElement(root, 'pick-up').text = ''.join(p.name + ';' for p in player.pickup)
+        return ET.tostring(root)
+
+
+class LoopbackClient(object):
+    """Stands in for tcpClient.TcpClient: orders sent go straight to the
+    LocalServer."""
+
+    def __init__(self, server, player):
+        self.server = server
+        self.player = player
+        self.messagesSent = 0
+        self.bytesSent = 0
+
+    def sendMessage(self, message):
+        self.messagesSent += 1
+        self.bytesSent += len(message)
+        self.server.receiveOrders(self.player, message)
+
+    def close(self):
+        pass
+
+
+class LocalServer(object):
+    """Plays a Game with Frameworks, in-process."""
+
+    def __init__(self, setup, frameworks):
+        """setup -- The <setup> element (see generateSetup).
+        frameworks -- One framework.Framework per player in setup, in order.
+        latencies -- {guid: [seconds each incomingMessage took]}.
+        messages -- Number of messages delivered to frameworks.
+
+        """
+        self.setup = setup
+        self.game = Game(setup)
+        self.frameworks = frameworks
+        self.latencies = dict((p.guid, []) for p in self.game.players)
+        self.messages = 0
+        for player, fwk in zip(self.game.players, frameworks):
+            fwk.client = LoopbackClient(self, player)
+
+    def receiveOrders(self, player, message):
+        xml = ET.XML(message)
+        if xml.tag not in ('ready', 'move'):
+            return
+        path = []
+        elem = xml.find('path')
+        if elem is not None and elem.text:
+            path = Path.parse(elem.text)
+        pickup = []
+        elem = xml.find('pick-up')
+        if elem is not None and elem.text:
+            names = set(n.strip() for n in elem.text.split(';') if n.strip())
+            pickup = [p for p in self.game.passengers if p.name in names]
+        self.game.setOrders(player, path, pickup)
+
+    def _send(self, player, message):
+        fwk = self.frameworks[self.game.players.index(player)]
+        start = instrument.wallClock()
+        fwk.incomingMessage(message)
+        self.latencies[player.guid].append(instrument.wallClock() - start)
+        self.messages += 1
+
+    def play(self, maxTicks):
+        """Send setup, then play until maxTicks or every passenger is done."""
+        for player in self.game.players:
+            self.setup.set('my-guid', player.guid)
+            self._send(player, ET.tostring(self.setup))
+        while self.game.ticks < maxTicks and not self.game.isOver():
+            for status, about in self.game.step():
+                message = self.game.statusXml(status, about)
+                for player in self.game.players:
+                    self._send(player, message)
+            # the time between ticks (see Framework.idle)
+            for fwk in self.frameworks:
+                while fwk.idle():
+                    pass
+        return self.game
@@ -0,0 +1,135 @@
+"""
+Module metrics: serves what instrument has measured over HTTP, so a running
+bot can be watched from outside.
+
+    WINDWARD_METRICS_PORT=9107 python framework.py ...
+    curl http://127.0.0.1:9107/metrics        (Prometheus text format)
+    curl http://127.0.0.1:9107/metrics.json   (the same as JSON)
+
+WINDWARD_METRICS_SOCKET=/tmp/bot.sock serves the same on a Unix socket
+instead (curl --unix-socket /tmp/bot.sock http://x/metrics).
+
+The server runs on its own daemon thread. A request takes an
+instrument.snapshot() - copies, made without any lock the dispatch thread
+takes - and formats it there, so scraping never holds up a turn.
+
+What is in it: every instrument histogram (turn and phase latencies, path
+searches, ...) with its power-of-two buckets, every instrument counter
+(messages received and dropped, orders sent and suppressed, cache hits and
+misses, ...) and every gauge (receive queue depth, reconnects, path search
+totals, ...). See Framework._registerGauges for the gauges.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os, re, json, threading
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import UnixStreamServer
+except ImportError: # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import UnixStreamServer
+
+import instrument
+from debug import log
+
+HOST = "127.0.0.1"
+"""Only local clients - this is for watching our own bot."""
+PREFIX = "windward_"
+
+
+def _metricName(name):
+    return PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def prometheus(snapshot):
+    """The snapshot as Prometheus text exposition format."""
+    lines = []
+    for name, hist in sorted(snapshot["histograms"].items()):
+        metric = _metricName(name) + "_seconds"
+        lines.append("# TYPE %s histogram" % metric)
+        seen = 0
+        # the last bucket is the overflow one - it is only in +Inf
+        for index, n in enumerate(hist["buckets"][:-1]):
+            seen += n
+            lines.append('%s_bucket{le="%.6f"} %d' % (metric, (1 << index) / 1000000, seen))
+        lines.append('%s_bucket{le="+Inf"} %d' % (metric, hist["count"]))
+        lines.append("%s_sum %r" % (metric, hist["sum"]))
+        lines.append("%s_count %d" % (metric, hist["count"]))
+        lines.append("# TYPE %s_cpu_seconds_total counter" % metric[:-8])
+        lines.append("%s_cpu_seconds_total %r" % (metric[:-8], hist["cpuSum"]))
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _metricName(name) + "_total"
+        lines.append("# TYPE %s counter" % metric)
+        lines.append("%s %d" % (metric, value))
+    for name, value in sorted(snapshot["gauges"].items()):
+        if value is None:
+            continue
+        metric = _metricName(name)
+        lines.append("# TYPE %s gauge" % metric)
+        lines.append("%s %r" % (metric, value))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == "/metrics":
+            body = prometheus(instrument.snapshot())
+            contentType = "text/plain; version=0.0.4"
+        elif path == "/metrics.json":
+            body = json.dumps(instrument.snapshot(), sort_keys=True)
+            contentType = "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address) # a Unix socket has no host
+
+    def log_message(self, format, *args):
+        pass # not on our console
+
+
+class UnixHTTPServer(UnixStreamServer):
+
+    def get_request(self):
+        request, _ = UnixStreamServer.get_request(self)
+        return request, ("local", 0)
+
+
+def start(port=None, socketPath=None):
+    """Serve metrics on port (on HOST) or on the Unix socket socketPath, from
+    a daemon thread. Returns the server."""
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = UnixHTTPServer(socketPath, MetricsHandler)
+        where = socketPath
+    else:
+        server = HTTPServer((HOST, port), MetricsHandler)
+        where = "http://%s:%d/metrics" % (HOST, server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, name="Metrics")
+    thread.daemon = True
+    thread.start()
+    log.info("Serving metrics on %s", where)
+    return server
+
+def fromEnvironment():
+    """start() as WINDWARD_METRICS_PORT / WINDWARD_METRICS_SOCKET say, or
+    None if neither is set."""
+    socketPath = os.environ.get("WINDWARD_METRICS_SOCKET")
+    port = os.environ.get("WINDWARD_METRICS_PORT")
+    if socketPath:
+        return start(socketPath=socketPath)
+    if port:
+        return start(port=int(port))
+    return None
@@ -10,20 +10,47 @@ No copyright claimed - do anything you want with this code.
 """
 from __future__ import division
 
-import random
-import simpleAStar
-from framework import sendOrders
+import random, logging
+import simpleAStar, tourPlanner, setupPipeline, instrument, scoring
+import weightedPath, congestion, travelTime, orders
+import framework
 from api import units, map
-from debug import printrap
+from debug import printrap, log
+
+# orders that would change nothing the server has are not sent (orders.py)
+sendOrders = orders.suppressing(framework.sendOrders)
 
 
 
 from xml.etree import ElementTree as ET
 import traceback
-import __builtin__
 
 NAME = "Tejas, Zongyi, Cheng, Neil Python"
 SCHOOL = "Uoft"
+LOOK_AHEAD = False # experimental: put the first pickup of the best planned tour first (tourPlanner)
+SPECULATE = True # work out our next orders while waiting for messages
+AVOID_LIMOS = False # route around where the other limos are heading
+ROUTE_WEIGHT = 1.0 # > 1 for faster, up to that much costlier, routes (weightedPath)
+TRAVEL_TIME = False # route by stop signs, signals and turns, not tiles (travelTime)
+
+
+class Speculation(object):
+    """Orders worked out in advance for the next thing we expect to happen
+    to our limo (see MyPlayerBrain.idle).
+
+    status -- The status we expect.
+    passenger -- The passenger it happens to (delivered or picked up).
+    signature -- MyPlayerBrain._signature of the state we expect then.
+    pickup, path -- The orders to send.
+    """
+    __slots__ = ('status', 'passenger', 'signature', 'pickup', 'path')
+
+    def __init__(self, status, passenger, signature, pickup, path):
+        self.status = status
+        self.passenger = passenger
+        self.signature = signature
+        self.pickup = pickup
+        self.path = path
 
 class MyPlayerBrain(object):
     """The Python AI class.  This class must have the methods setup and gameStatus."""
@@ -41,6 +68,27 @@ class MyPlayerBrain(object):
         except IOError:
             avatar = None # avatar is optional
         self.avatar = avatar
+        self.useLookAhead = LOOK_AHEAD
+        self.lookAheadDepth = tourPlanner.DEPTH
+        self.setupDeadline = setupPipeline.SETUP_DEADLINE
+        self.tables = None
+        self.useSpeculation = SPECULATE
+        self.avoidLimos = AVOID_LIMOS
+        self.routeWeight = ROUTE_WEIGHT
+        self.useTravelTime = TRAVEL_TIME
+        self.congestion = None
+        self.speculation = {"computed": 0, "hits": 0, "misses": 0}
+        self._resetCaches()
+
+    def _resetCaches(self):
+        # Scoring caches, kept valid by statusChanged. They are only used once
+        # the framework has started sending us change sets.
+        self._tracking = False
+        self._toPassenger = {} # passenger -> path length from our limo to their lobby
+        self._toDestination = {} # passenger -> path length from lobby to destination
+        self._ranking = None # last result of allPickups for self.me
+        self._speculation = None # a Speculation, or None
+        self._speculationStale = True # the world has changed since it was made
     
     def setup(self, gMap, me, allPlayers, companies, passengers, client):
         """
@@ -60,6 +108,28 @@ class MyPlayerBrain(object):
         self.companies = companies
         self.passengers = passengers
         self.client = client
+        self._resetCaches()
+
+        # distances to every bus stop, built in the background. We use what
+        # is ready by the deadline; the rest fills in during the first turns.
+        if self.tables is not None:
+            self.tables.close()
+        busiest = sorted(companies, key=lambda c: len(c.passengers), reverse=True)
+        self.tables = setupPipeline.DistanceTables(gMap, [c.busStop for c in busiest])
+        self.tables.start()
+        self.tables.wait(self.setupDeadline)
+
+        self.planner = tourPlanner.TourPlanner(tourPlanner.StopDistances(gMap, self.tables),
+                                               depth=self.lookAheadDepth)
+        self.congestion = None
+        if self.avoidLimos:
+            self.congestion = congestion.Congestion(gMap, self.tables)
+            self.congestion.update(allPlayers, me)
+        # the weighted searches' tables - build them now, not in a turn
+        if self.useTravelTime:
+            gMap.entryCosts
+        if self.useTravelTime or self.congestion is not None or self.routeWeight != 1:
+            gMap.landmarks
 
         self.pickup = pickup = self.allPickups(me, passengers, self.players)
 
@@ -98,6 +168,10 @@ class MyPlayerBrain(object):
             pickup = []
             if    status == "UPDATE":
                 return
+            self._speculationStale = True
+            if self._speculationHolds(status):
+                sendOrders(self, "move", self._speculation.path, self._speculation.pickup)
+                return
             elif ((status == "PASSENGER_NO_ACTION" or
                   status == "NO_PATH") and playerStatus == self.me):
                 if playerStatus.limo.passenger is None:
@@ -111,7 +185,7 @@ class MyPlayerBrain(object):
                 ptDest = pickup[0].lobby.busStop
             elif  status == "PASSENGER_REFUSED":
                 pickup = self.allPickups(self.me, passengers, players)
-                ptDest = pickup[0].lobby
+                ptDest = pickup[0].lobby.busStop
             elif (status == "PASSENGER_DELIVERED_AND_PICKED_UP" or
                   status == "PASSENGER_PICKED_UP"):
                 pickup = self.allPickups(self.me, passengers, players)
@@ -128,45 +202,228 @@ class MyPlayerBrain(object):
             printrap ("somefin' bad, foo'!")
             raise e
 
+    def statusChanged(self, changes):
+        """Called by the framework with the api.units.ChangeSet of each status
+        message, before gameStatus. Drops only the cached scoring that the
+        changes make stale."""
+        self._tracking = True
+        me = self.me
+        if self.congestion is not None:
+            # ours too - it reserves nothing but tells the layer the time
+            for player in changes.movedLimos | changes.limoPassengerChanged:
+                self.congestion.moved(player)
+        if (changes.passengersChanged() or changes.companiesChanged() or
+            me in changes.limoPassengerChanged):
+            self._speculationStale = True
+        for psngr in changes.lobbyChanged | changes.destinationChanged:
+            self._toPassenger.pop(psngr, None)
+            self._toDestination.pop(psngr, None)
+        if me in changes.movedLimos:
+            self._toPassenger.clear()
+        if (me in changes.movedLimos or me in changes.delivered or
+            me in changes.limoPassengerChanged or changes.passengersChanged() or
+            changes.companiesChanged()):
+            self._ranking = None
+
+    def idle(self):
+        """Called (by the framework) while no message is waiting. Works out
+        the orders for the next thing we expect to happen to our limo - it
+        gets to where its path ends and delivers its passenger, or picks up
+        the one we are going for - so gameStatus can send them at once if
+        that is what happens. Returns True if it did any work."""
+        if not self.useSpeculation or not self._speculationStale or not hasattr(self, 'me'):
+            return False
+        self._speculationStale = False
+        self._speculation = self._speculate()
+        if self._speculation is not None:
+            self.speculation["computed"] += 1
+        return True
+
+    def _speculate(self):
+        """Play the next event forward on our own objects, work out the
+        orders then, and put everything back. Returns a Speculation or None."""
+        me = self.me
+        limo = me.limo
+        passenger = limo.passenger
+        if passenger is not None:
+            status = "PASSENGER_DELIVERED"
+            company = passenger.destination
+            if company is None or company.wouldRefuse(passenger):
+                return None # it will be refused
+        else:
+            status = "PASSENGER_PICKED_UP"
+            if len(limo.path) < 2:
+                return None
+            # calculatePathPlus1 ends the path one step past the bus stop
+            stop = limo.path[-2]
+            waiting = [p for p in me.pickup if p.lobby is not None and p.lobby.busStop == stop]
+            if not waiting:
+                return None
+            passenger = waiting[0]
+            company = passenger.lobby
+
+        saved = (limo.tilePosition, limo.passenger, passenger.car, passenger.lobby,
+                 list(company.passengers), dict(company.enemiesWaiting), self._tracking,
+                 len(me.passengersDelivered))
+        try:
+            limo.tilePosition = company.busStop
+            self._tracking = False # the caches are for where we are now
+            if status == "PASSENGER_DELIVERED":
+                limo.passenger = None
+                passenger.car = None
+                me.passengersDelivered.append(passenger)
+                if passenger.route:
+                    company.arrive(passenger)
+                pickup = self.allPickups(me, self.passengers, self.players)
+                if not pickup:
+                    return None
+                ptDest = pickup[0].lobby.busStop
+            else:
+                limo.passenger = passenger
+                passenger.car = limo
+                passenger.lobby = None
+                company.leave(passenger)
+                pickup = self.allPickups(me, self.passengers, self.players)
+                ptDest = passenger.destination.busStop
+            path = self.calculatePathPlus1(me, ptDest)
+            signature = self._signature(passenger)
+        finally:
+            (limo.tilePosition, limo.passenger, passenger.car, passenger.lobby,
+             company.passengers[:], enemiesWaiting, self._tracking, delivered) = saved
+            company.enemiesWaiting.clear()
+            company.enemiesWaiting.update(enemiesWaiting)
+            del me.passengersDelivered[delivered:]
+        return Speculation(status, passenger, signature, pickup, path)
+
+    def _speculationHolds(self, status):
+        """True if the Speculation made for status is still right."""
+        spec = self._speculation
+        if spec is None or spec.status != status:
+            return False
+        if spec.signature == self._signature(spec.passenger):
+            self.speculation["hits"] += 1
+            return True
+        self.speculation["misses"] += 1
+        return False
+
+    def _signature(self, passenger):
+        """Everything allPickups and the path depend on, except passenger
+        (who is in our limo or delivered, so is not a candidate). Our angle
+        counts only when routing by travel time (the path starts from our
+        heading); the congestion generation changes whenever the other
+        limos' reservations do."""
+        me = self.me
+        return (me.limo.tilePosition, me.limo.angle if self.useTravelTime else None,
+                me.limo.passenger, len(me.passengersDelivered),
+                self.congestion.generation if self.congestion is not None else None,
+                tuple([(p.lobby, p.destination, p.car is None) for p in self.passengers
+                       if p is not passenger]),
+                tuple([tuple(c.passengers) for c in self.companies]))
+
     def calculatePathPlus1 (self, me, ptDest):
-        path = simpleAStar.calculatePath(self.gameMap, me.limo.tilePosition, ptDest)
+        extraCost = self.congestion.cost if self.congestion is not None else None
+        if self.useTravelTime:
+            path = weightedPath.calculateFastestPath(self.gameMap, me.limo.tilePosition, ptDest,
+                                                     travelTime.heading(me.limo.angle),
+                                                     extraCost, self.routeWeight)
+        elif extraCost is not None or self.routeWeight != 1:
+            path = weightedPath.calculateWeightedPath(self.gameMap, me.limo.tilePosition, ptDest,
+                                                      extraCost, self.routeWeight)
+        else:
+            path = simpleAStar.calculatePath(self.gameMap, me.limo.tilePosition, ptDest)
         # add in leaving the bus stop so it has orders while we get the message
         # saying it got there and are deciding what to do next.
         if len(path) > 1:
             path.append(path[-2])
         return path
     
+    def pathLength(self, start, busStop):
+        """Number of tiles in the path from start to busStop (inclusive) -
+        from the distance tables if they have it, else searched for."""
+        if self.tables is not None:
+            ticks = self.tables.distance(start, busStop)
+            if ticks is not None and ticks >= 0:
+                instrument.count('distanceTables.hits')
+                return ticks + 1
+        instrument.count('distanceTables.misses')
+        return len(simpleAStar.calculatePath(self.gameMap, start, busStop))
+
     def easierForYou(self, passenger, me, otherAi):
-        toPassenger = len(simpleAStar.calculatePath(self.gameMap, me.limo.tilePosition, passenger.lobby.busStop))
-        otherAiToPassenger = len(simpleAStar.calculatePath(self.gameMap, otherAi.limo.tilePosition, passenger.lobby.busStop))
+        toPassenger = self.pathLength(me.limo.tilePosition, passenger.lobby.busStop)
+        otherAiToPassenger = self.pathLength(otherAi.limo.tilePosition, passenger.lobby.busStop)
         return True if toPassenger < otherAiToPassenger else False
     
     def allPickups (self, me, passengers, players):
-            def distanceFromUs(p):
-                toPassenger = len(simpleAStar.calculatePath(self.gameMap, me.limo.tilePosition, p.lobby.busStop))
-                toDest = len(simpleAStar.calculatePath(self.gameMap, p.lobby.busStop, p.destination.busStop))
-                return toPassenger + toDest
-            def keyFunc(p):
-                return (100*p.pointsDelivered)/distanceFromUs(p)
-            
-            pickup = [p for p in passengers if (not p in me.passengersDelivered and
-                                                p != me.limo.passenger and
-                                                p.car is None and
-                                                p.lobby is not None and p.destination is not None)]
-            tempPickup = filter(lambda x: len([y for y in x.enemies if y in x.destination.passengers]) ==0, pickup)
-            if len(tempPickup) > 0:
-                pickup = tempPickup
+            tracking = self._tracking and me is self.me
+            if tracking and self._ranking is not None:
+                instrument.count('ranking.hits')
+                return list(self._ranking)
+            instrument.count('ranking.misses')
+            toPassengerCache = self._toPassenger if tracking else {}
+            toDestinationCache = self._toDestination if tracking else {}
+
+            # gather the candidates into parallel arrays and rank them in one
+            # pass (see scoring.py)
+            candidates = list(passengers)
+            batch = scoring.Candidates(len(candidates))
+            delivered = set(me.passengersDelivered)
+            riding = me.limo.passenger
+            for i, p in enumerate(candidates):
+                batch.points[i] = p.pointsDelivered
+                batch.free[i] = p.car is None
+                batch.delivered[i] = p in delivered
+                batch.riding[i] = p == riding
+                if p.lobby is not None and p.destination is not None:
+                    batch.placed[i] = 1
+                    # they would refuse to get out if an enemy is waiting there
+                    batch.refuses[i] = p.destination.wouldRefuse(p)
+            scoring.masks(batch)
             """Not Sure about this Part Yet"""
 #             for player in players:
-#                 tempPickup = filter(lambda x: self.easierForYou(x, me, player), pickup)
+#                 tempPickup = [x for x in pickup if self.easierForYou(x, me, player)]
 #                 if len(tempPickup) > 0:
 #                     pickup = tempPickup
-            values = __builtin__.map(lambda x: (x, keyFunc(x)), pickup)
-            values = sorted(values, key=lambda x: x[1], reverse=True)
-            pickup = __builtin__.map(lambda x: x[0], values)
-            print values                    
+            here = me.limo.tilePosition
+            indexes = scoring.chosen(batch)
+            for i in indexes:
+                p = candidates[i]
+                toPassenger = toPassengerCache.get(p)
+                if toPassenger is None:
+                    instrument.count('pickupDistances.misses')
+                    toPassenger = toPassengerCache[p] = self.pathLength(here, p.lobby.busStop)
+                toDest = toDestinationCache.get(p)
+                if toDest is None:
+                    instrument.count('pickupDistances.misses')
+                    toDest = toDestinationCache[p] = self.pathLength(p.lobby.busStop, p.destination.busStop)
+                batch.toPassenger[i] = toPassenger
+                batch.toDestination[i] = toDest
+            order = scoring.rank(batch, indexes)
+            pickup = [candidates[i] for i in order]
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("pickups: %r", [(candidates[i], scoring.score(batch, i)) for i in order])
+            if self.useLookAhead and len(pickup) > 1:
+                pickup = self.lookAhead(pickup, toPassengerCache)
+            if tracking:
+                self._ranking = list(pickup)
             return pickup
         
+    def lookAhead(self, pickup, toPassenger):
+        """Move the passenger the tour planner would get first to the front.
+
+        pickup -- The candidates, best greedy score first.
+        toPassenger -- {passenger: path length from our limo to their lobby}.
+        """
+        toStop = {}
+        for p in pickup:
+            toStop[p.lobby.busStop] = toPassenger[p] - 1
+        legs = [tourPlanner.legsFor(p) for p in pickup]
+        value, tour = self.planner.plan(toStop, [leg for leg in legs if leg is not None])
+        if not tour:
+            return pickup
+        first = tour[0].passenger
+        log.debug("tour: %r (value %.2f, %d nodes)", tour, value, self.planner.nodes)
+        return [first] + [p for p in pickup if p is not first]
+
     def sortPickUps(self, me, passengers, players):
         pass
             
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Module orders: what goes out to the server - writing order messages and
+dropping the ones that would change nothing.
+
+formatOrders(order, path, pickup) -- the <ready>/<move> message text, written
+    directly rather than through an ElementTree.
+isRedundant(me, path, pickup) -- True if the server already has these orders.
+suppressing(sendOrders) -- framework.sendOrders wrapped so redundant orders
+    are dropped; the brain sends through this.
+stats -- OrderStats counting the orders sent and the ones suppressed.
+
+An order is redundant when its path is the one our limo is already on (from
+the tile it is on now) and its pick-up list is the one it already has. "What
+it already has" is our Player: the framework sets it from each status about
+us and sendOrders sets it from each order sent, so it is the last orders the
+server acknowledged or has been sent since. An empty path or pick-up list is
+no change, as in sendOrders - but an order with both empty is an explicit
+stop and is always sent, as is a "ready" (our reply to setup). Set ENABLED = False (or WINDWARD_SUPPRESS_ORDERS=0) to send every
+order.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from api.path import Path
+
+ENABLED = os.environ.get("WINDWARD_SUPPRESS_ORDERS", "1") != "0"
+
+
+def formatOrders(order, path, pickup):
+    """Return the message for order ("ready" or "move") with path (list of
+    (x, y) tiles) and pickup (list of Passengers), as sendOrders sends it."""
+    parts = ['<', order, '>']
+    if len(path) > 0:
+        parts.append('<path>')
+        if isinstance(path, Path):
+            parts.append(path.format())
+        else:
+            parts.append(('%d,%d;' * len(path)) % tuple(chain.from_iterable(path)))
+        parts.append('</path>')
+    if len(pickup) > 0:
+        parts.append('<pick-up>')
+        parts.append(escape(''.join([psngr.name + ';' for psngr in pickup])))
+        parts.append('</pick-up>')
+    if len(parts) == 3:
+        return '<%s />' % order
+    parts.append('</%s>' % order)
+    return ''.join(parts)
+
+def isRedundant(me, path, pickup):
+    """True if sending path and pickup would not change what me (our Player)
+    already has."""
+    if len(path) == 0 and len(pickup) == 0:
+        return False # an explicit stop - the server may have drifted
+    if len(pickup) > 0 and list(pickup) != list(me.pickup):
+        return False
+    if len(path) > 0:
+        here = me.limo.tilePosition
+        known = me.limo.path
+        start = 1 if len(known) > 0 and tuple(known[0]) == here else 0
+        skip = 1 if tuple(path[0]) == here else 0
+        if len(path) - skip != len(known) - start:
+            return False
+        if isinstance(path, Path) and isinstance(known, Path):
+            return path.ids[skip:] == known.ids[start:]
+        for i in range(len(path) - skip):
+            if tuple(path[skip + i]) != tuple(known[start + i]):
+                return False
+    return True
+
+def suppressing(sendOrders):
+    """sendOrders (framework.sendOrders) wrapped to drop redundant orders
+    and count what is sent and dropped in stats."""
+    def send(brain, order, path, pickup):
+        length = len(formatOrders(order, path, pickup))
+        if ENABLED and order != "ready" and isRedundant(brain.me, path, pickup):
+            stats.suppressed += 1
+            stats.bytesSaved += length
+            return
+        stats.sent += 1
+        stats.bytesSent += length
+        sendOrders(brain, order, path, pickup)
+    return send
+
+
+class OrderStats(object):
+    """Counts of the orders sent and suppressed."""
+
+    def __init__(self):
+        """sent -- Orders sent.
+        bytesSent -- Length of the orders sent.
+        suppressed -- Orders not sent because they were redundant.
+        bytesSaved -- Length of the orders not sent.
+
+        """
+        self.sent = 0
+        self.bytesSent = 0
+        self.suppressed = 0
+        self.bytesSaved = 0
+
+    def report(self):
+        total = self.sent + self.suppressed
+        return ("orders: %d sent (%d bytes), %d suppressed (%d bytes, %.1f%% of orders)" %
+                (self.sent, self.bytesSent, self.suppressed, self.bytesSaved,
+                 100.0 * self.suppressed / total if total else 0.0))
+
+stats = OrderStats()
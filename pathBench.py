@@ -0,0 +1,425 @@
+"""
+Module pathBench: a yardstick for path searches. Runs simpleAStar.calculatePath
+(and any other engine) over generated maps and checks every path against a
+breadth-first search.
+
+    python pathBench.py --pairs 200 --sizes 24x18,48x36,96x72
+    python pathBench.py --kinds maze,corridor --engines astar-manhattan
+
+Maps (KINDS) are road networks built to be hard in different ways:
+    grid -- city blocks as in localServer.generateSetup, with gaps.
+    maze -- a perfect maze: one way between any two tiles, many turns.
+    corridor -- one long road snaking back and forth across the map.
+    deadends -- a grid with many short spurs that lead nowhere.
+
+For every map, random start and end road tiles are searched by each engine
+(ENGINES). A path is legal if it runs from start to end over driveable tiles,
+one step at a time; it is optimal if it is as short as the breadth-first
+search (landmarks.distancesFrom) says it can be. Reported per engine, map
+kind and size: searches, illegal paths (and exceptions), timeouts,
+suboptimal paths and their mean excess length, wall time per search, nodes
+expanded per search, and peak memory per search (tracemalloc - Python 3
+only, and measured in a second pass so it does not slow the timed one).
+
+A search that runs past --timeout seconds is stopped (with a SIGALRM timer,
+where there is one) and counted. The exit status is 1 if any engine gave an
+illegal path, raised or timed out (and with --strict, if any path was
+suboptimal).
+
+The fastest engine (weightedPath.calculateFastestPath) minimises travel
+time, counting curves and turns, so some of its paths are longer in tiles
+and show as suboptimal here.
+
+To try a new engine add (name, function(gmap, start, end) -> path,
+function() -> total expansions so far or None) to ENGINES.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import sys, random, argparse, signal
+from collections import deque
+from xml.etree import ElementTree as ET
+try:
+    import tracemalloc
+except ImportError: # Python 2
+    tracemalloc = None
+
+import instrument, landmarks, localServer, simpleAStar, weightedPath
+from api import map
+from api.path import Path
+# the same on Python 2 and 3 for a seed
+from localServer import _randint
+
+KINDS = ("grid", "maze", "corridor", "deadends")
+SIZES = ((24, 18), (48, 36), (96, 72))
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# ---- maps
+
+def _connected(road):
+    if not road:
+        return True
+    start = min(road)
+    seen = set([start])
+    todo = [start]
+    while todo:
+        x, y = todo.pop()
+        for dx, dy in localServer.STEPS:
+            n = (x + dx, y + dy)
+            if n in road and n not in seen:
+                seen.add(n)
+                todo.append(n)
+    return len(seen) == len(road)
+
+def gridRoads(rand, width, height, block=4, gaps=.15):
+    road = set((x, y) for x in range(1, width - 1) for y in range(1, height - 1)
+               if x % block == 1 or y % block == 1)
+    crossings = [t for t in sorted(road) if t[0] % block != 1 or t[1] % block != 1]
+    for n in range(int(len(crossings) * gaps)):
+        tile = crossings[_randint(rand, 0, len(crossings) - 1)]
+        if tile in road:
+            road.discard(tile)
+            if not _connected(road):
+                road.add(tile)
+    return road
+
+def mazeRoads(rand, width, height):
+    # depth-first carving over the cells at odd x and y
+    start = (1, 1)
+    road = set([start])
+    stack = [start]
+    while stack:
+        x, y = stack[-1]
+        options = [(dx, dy) for dx, dy in localServer.STEPS
+                   if 0 < x + 2 * dx < width - 1 and 0 < y + 2 * dy < height - 1 and
+                   (x + 2 * dx, y + 2 * dy) not in road]
+        if not options:
+            stack.pop()
+            continue
+        dx, dy = options[_randint(rand, 0, len(options) - 1)]
+        road.add((x + dx, y + dy))
+        road.add((x + 2 * dx, y + 2 * dy))
+        stack.append((x + 2 * dx, y + 2 * dy))
+    return road
+
+def corridorRoads(rand, width, height):
+    road = set()
+    rows = list(range(1, height - 1, 2))
+    for index, y in enumerate(rows):
+        road.update((x, y) for x in range(1, width - 1))
+        if index + 1 < len(rows):
+            x = width - 2 if index % 2 == 0 else 1
+            road.add((x, y + 1))
+    return road
+
+def deadEndRoads(rand, width, height, block=6):
+    road = gridRoads(rand, width, height, block, gaps=0)
+    for tile in sorted(road):
+        if rand.random() < .25:
+            dx, dy = localServer.STEPS[_randint(rand, 0, 3)]
+            for step in range(1, _randint(rand, 1, block // 2)):
+                spur = (tile[0] + dx * step, tile[1] + dy * step)
+                if not (0 < spur[0] < width - 1 and 0 < spur[1] < height - 1):
+                    break
+                # stop short of joining another road - a spur must not lead anywhere
+                ahead = (spur[0] + dx, spur[1] + dy)
+                if spur in road or ahead in road:
+                    break
+                road.add(spur)
+    return road
+
+ROADS = {"grid": gridRoads, "maze": mazeRoads, "corridor": corridorRoads,
+         "deadends": deadEndRoads}
+
+def makeMap(road, width, height):
+    """An api.map.Map of width x height with road (a set of tiles) driveable."""
+    element = ET.Element('map', {'width': str(width), 'height': str(height),
+                                 'units-tile': '24'})
+    def isRoad(x, y):
+        return (x, y) in road
+    for x in range(width):
+        for y in range(height):
+            attrs = {'x': str(x), 'y': str(y)}
+            if (x, y) in road:
+                attrs['type'] = 'ROAD'
+                attrs['direction'] = localServer.roadDirection(
+                    isRoad(x, y - 1), isRoad(x + 1, y), isRoad(x, y + 1), isRoad(x - 1, y))
+            else:
+                attrs['type'] = 'PARK'
+            ET.SubElement(element, 'tile', attrs)
+    return map.Map(element, [])
+
+
+# ---- engines
+
+def manhattan(end):
+    def estimate(tile):
+        return abs(tile[0] - end[0]) + abs(tile[1] - end[1])
+    return estimate
+
+def astarLandmarks(gmap, start, end):
+    return simpleAStar.calculatePath(gmap, start, end, gmap.landmarks.heuristic(end))
+
+def astarManhattan(gmap, start, end):
+    return simpleAStar.calculatePath(gmap, start, end)
+
+def weighted(gmap, start, end):
+    return weightedPath.calculateWeightedPath(gmap, start, end)
+
+def weighted15(gmap, start, end):
+    return weightedPath.calculateWeightedPath(gmap, start, end, weight=1.5)
+
+def fastest(gmap, start, end):
+    return weightedPath.calculateFastestPath(gmap, start, end)
+
+bfsExpansions = 0
+
+def bfsPath(gmap, start, end):
+    """Shortest path by breadth-first search (an engine to check the others
+    against, and the harness against)."""
+    global bfsExpansions
+    previous = {start: None}
+    frontier = deque([start])
+    while frontier:
+        tile = frontier.popleft()
+        bfsExpansions += 1
+        if tile == end:
+            break
+        for dx, dy in simpleAStar.OFFSETS:
+            n = (tile[0] + dx, tile[1] + dy)
+            if n not in previous:
+                square = gmap.squareOrDefault(n)
+                if square is not None and square.isDriveable():
+                    previous[n] = tile
+                    frontier.append(n)
+    path = []
+    tile = end if end in previous else None
+    while tile is not None:
+        path.append(tile)
+        tile = previous[tile]
+    path.reverse()
+    return Path(path)
+
+ENGINES = [
+    ("astar-landmarks", astarLandmarks, lambda: simpleAStar.expansions),
+    ("astar-manhattan", astarManhattan, lambda: simpleAStar.expansions),
+    ("weighted", weighted, lambda: weightedPath.expansions),
+    ("weighted-1.5", weighted15, lambda: weightedPath.expansions),
+    ("fastest", fastest, lambda: weightedPath.expansions),
+    ("bfs", bfsPath, lambda: bfsExpansions),
+]
+
+
+# ---- checking
+
+def checkPath(gmap, path, start, end):
+    """None if path is a legal way from start to end, else what is wrong."""
+    if len(path) == 0:
+        return "empty"
+    if tuple(path[0]) != start:
+        return "does not start at start"
+    if tuple(path[-1]) != end:
+        return "does not end at end"
+    last = None
+    for tile in path:
+        square = gmap.squareOrDefault(tile)
+        if square is None or not square.isDriveable():
+            return "off the road at %r" % (tile,)
+        if last is not None and abs(tile[0] - last[0]) + abs(tile[1] - last[1]) != 1:
+            return "jumps from %r to %r" % (last, tile)
+        last = tile
+    return None
+
+def _onAlarm(signum, frame):
+    raise SearchTimeout()
+
+def _search(find, gmap, start, end, timeout):
+    if timeout and hasattr(signal, 'setitimer'):
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return find(gmap, start, end)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return find(gmap, start, end)
+
+
+class EngineResult(object):
+    """What one engine did on one kind and size of map."""
+
+    def __init__(self):
+        """searches -- Searches made.
+        times -- Seconds per search that returned.
+        expansions -- Nodes expanded per search (empty if not counted).
+        peaks -- Peak bytes allocated per search (empty if not measured).
+        illegal -- Paths that were not legal, and searches that raised.
+        timeouts -- Searches stopped at the timeout.
+        suboptimal -- Legal paths longer than the shortest.
+        excess -- Sum over suboptimal paths of (length / shortest - 1).
+        problems -- A few (start, end, what was wrong), for the report.
+
+        """
+        self.searches = 0
+        self.times = []
+        self.expansions = []
+        self.peaks = []
+        self.illegal = 0
+        self.timeouts = 0
+        self.suboptimal = 0
+        self.excess = 0.0
+        self.problems = []
+
+    def add(self, other):
+        self.searches += other.searches
+        self.times += other.times
+        self.expansions += other.expansions
+        self.peaks += other.peaks
+        self.illegal += other.illegal
+        self.timeouts += other.timeouts
+        self.suboptimal += other.suboptimal
+        self.excess += other.excess
+        self.problems += other.problems
+
+
+def pairsFor(rand, road, count):
+    tiles = sorted(road)
+    pairs = []
+    while len(pairs) < count and len(tiles) > 1:
+        start = tiles[_randint(rand, 0, len(tiles) - 1)]
+        end = tiles[_randint(rand, 0, len(tiles) - 1)]
+        if start != end:
+            pairs.append((start, end))
+    return pairs
+
+def runMap(gmap, pairs, engines, timeout, memory):
+    """Search every pair with every engine. Returns {engine name: EngineResult}."""
+    width, height = gmap.width, gmap.height
+    grid = landmarks.driveableGrid(gmap)
+    shortest = {}
+    for start, end in pairs:
+        if end not in shortest:
+            shortest[end] = landmarks.distancesFrom(grid, width, height, end[0] * height + end[1])
+    results = {}
+    for name, find, counter in engines:
+        result = results[name] = EngineResult()
+        for start, end in pairs:
+            result.searches += 1
+            before = counter()
+            startTime = instrument.wallClock()
+            try:
+                path = _search(find, gmap, start, end, timeout)
+            except SearchTimeout:
+                result.timeouts += 1
+                result.problems.append((start, end, "timed out"))
+                continue
+            except Exception as e:
+                result.illegal += 1
+                result.problems.append((start, end, "raised %r" % e))
+                continue
+            result.times.append(instrument.wallClock() - startTime)
+            if before is not None:
+                result.expansions.append(counter() - before)
+            problem = checkPath(gmap, path, start, end)
+            if problem is not None:
+                result.illegal += 1
+                result.problems.append((start, end, problem))
+                continue
+            best = shortest[end][start[0] * height + start[1]]
+            if len(path) - 1 > best:
+                result.suboptimal += 1
+                result.excess += (len(path) - 1) / best - 1
+        if memory and tracemalloc is not None:
+            for start, end in pairs:
+                tracemalloc.start()
+                try:
+                    _search(find, gmap, start, end, timeout)
+                except Exception:
+                    pass
+                result.peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+    return results
+
+
+# ---- report
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+def report(rows):
+    """rows -- [(kind, (width, height), engine name, EngineResult)]."""
+    lines = ["%-9s %-6s %-16s %6s %7s %8s %10s %7s %8s %8s %9s %9s" %
+             ("map", "size", "engine", "paths", "illegal", "timeouts", "suboptimal",
+              "excess", "mean ms", "p99 ms", "expanded", "peak KB")]
+    for kind, (width, height), name, result in rows:
+        lines.append("%-9s %-6s %-16s %6d %7d %8d %10d %6.1f%% %8.3f %8.3f %9s %9s" % (
+            kind, "%dx%d" % (width, height), name, result.searches, result.illegal,
+            result.timeouts, result.suboptimal,
+            100 * result.excess / result.suboptimal if result.suboptimal else 0.0,
+            1000 * _mean(result.times),
+            1000 * _percentile(result.times, .99) if result.times else 0.0,
+            "%.1f" % _mean(result.expansions) if result.expansions else "-",
+            "%.1f" % (_mean(result.peaks) / 1024) if result.peaks else "-"))
+    return "\n".join(lines)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark and check path searches.")
+    parser.add_argument("--pairs", type=int, default=100, help="searches per map")
+    parser.add_argument("--maps", type=int, default=2, help="maps of each kind and size")
+    parser.add_argument("--sizes", default=",".join("%dx%d" % s for s in SIZES))
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--engines", default=",".join(e[0] for e in ENGINES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds before a search is stopped (0 for never)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--strict", action="store_true",
+                        help="fail on suboptimal paths too")
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(n) for n in size.split('x')) for size in args.sizes.split(',')]
+    kinds = args.kinds.split(',')
+    names = args.engines.split(',')
+    engines = [e for e in ENGINES if e[0] in names]
+    if args.timeout and hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, _onAlarm)
+
+    rand = random.Random(args.seed)
+    rows = []
+    failed = False
+    for kind in kinds:
+        for width, height in sizes:
+            totals = dict((name, EngineResult()) for name, _, _ in engines)
+            for n in range(args.maps):
+                road = ROADS[kind](rand, width, height)
+                gmap = makeMap(road, width, height)
+                pairs = pairsFor(rand, road, args.pairs)
+                for name, result in runMap(gmap, pairs, engines, args.timeout,
+                                           args.memory).items():
+                    totals[name].add(result)
+            for name, _, _ in engines:
+                result = totals[name]
+                rows.append((kind, (width, height), name, result))
+                if result.illegal or result.timeouts or (args.strict and result.suboptimal):
+                    failed = True
+
+    print(report(rows))
+    for kind, size, name, result in rows:
+        for start, end, problem in result.problems[:3]:
+            print("%s %dx%d %s: %r -> %r %s" % (kind, size[0], size[1], name, start, end, problem))
+    if args.memory and tracemalloc is None:
+        print("(no peak memory - tracemalloc needs Python 3)")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,214 @@
+"""
+Module profiler: capture a profile of turns that go over budget.
+
+Opt-in (see fromEnvironment) - when it is off the framework never calls in
+here. When it is on, turns run unprofiled until one is slow; then the next
+few turns (PROFILE_TURNS) are profiled by one of:
+
+sample -- a background thread samples the dispatch thread's stack every few
+    milliseconds. Between armed turns it waits on an event, so normal turns
+    do not share the GIL with it.
+cprofile -- the turns run under cProfile (exact call counts, but much
+    slower while armed).
+
+When a turn takes longer than the threshold the profile, the status XML that
+triggered it, and a summary of the brain's state are written to a new
+directory under the capture directory. Only the newest captures are kept.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os, sys, time, shutil, threading
+from collections import defaultdict
+
+from debug import printrap
+
+MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = .002
+"""Seconds between stack samples of the dispatch thread."""
+PROFILE_TURNS = 5
+"""Number of turns profiled after a slow turn."""
+KEEP = 20
+"""Number of captures kept in the capture directory."""
+
+
+def fromEnvironment(threshold):
+    """Return a TurnProfiler configured from the environment, or None.
+
+    WINDWARD_PROFILE_DIR -- Where to write captures. Profiling is off if unset.
+    WINDWARD_PROFILE_THRESHOLD -- Turn time (seconds) that triggers a capture.
+    WINDWARD_PROFILE_MODE -- 'sample' (the default) or 'cprofile'.
+
+    """
+    directory = os.environ.get("WINDWARD_PROFILE_DIR")
+    if not directory:
+        return None
+    threshold = float(os.environ.get("WINDWARD_PROFILE_THRESHOLD", threshold))
+    mode = os.environ.get("WINDWARD_PROFILE_MODE", 'sample')
+    return TurnProfiler(directory, threshold, mode)
+
+
+class TurnProfiler(object):
+    """Watches turns and saves a capture for each one over the threshold."""
+
+    def __init__(self, directory, threshold, mode='sample', keep=KEEP):
+        """directory -- The capture directory (created if needed).
+        threshold -- Turn time in seconds that triggers a capture.
+        mode -- One of MODES.
+        keep -- How many captures to keep; older ones are deleted.
+        captures -- Number of captures written so far.
+
+        """
+        assert mode in MODES
+        self.directory = directory
+        self.threshold = threshold
+        self.mode = mode
+        self.keep = keep
+        self.captures = 0
+        self._turn = 0
+        self._samples = None
+        self._thread = None
+        self._profile = None
+        self._armed = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if mode == 'sample':
+            self._active = threading.Event()
+            sampler = threading.Thread(target=self._sample, name="TurnSampler")
+            sampler.daemon = True
+            sampler.start()
+
+    def begin(self):
+        """Call on the dispatch thread at the start of a turn."""
+        self._turn += 1
+        if self._armed <= 0:
+            return
+        self._armed -= 1
+        if self.mode == 'sample':
+            self._samples = defaultdict(int)
+            self._thread = threading.current_thread().ident
+            self._active.set()
+        else:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def end(self, turnTime, message, brain):
+        """Call on the dispatch thread at the end of a turn.
+
+        turnTime -- How long the turn took (wall clock seconds).
+        message -- The message (XML text) that was processed this turn.
+        brain -- The brain, for the state summary.
+
+        """
+        profileText = None
+        samples, self._samples = self._samples, None
+        stats, self._profile = self._profile, None
+        if samples is not None:
+            self._active.clear()
+            if turnTime >= self.threshold:
+                # copy first - the sampler may still be adding to it
+                profileText = formatSamples(dict(samples), SAMPLE_INTERVAL)
+        elif stats is not None:
+            stats.disable()
+        elif turnTime >= self.threshold:
+            # not profiled - profile the turns that follow instead.
+            self._armed = PROFILE_TURNS
+        if turnTime < self.threshold:
+            return
+        summary = summarizeBrain(brain)
+        # the writing is done off the dispatch thread so it does not slow
+        # down the next turn.
+        writer = threading.Thread(target=self._save,
+                                  args=(self._turn, turnTime, message,
+                                        summary, profileText, stats))
+        writer.daemon = True
+        writer.start()
+
+    def _sample(self):
+        frames = sys._current_frames
+        while True:
+            self._active.wait()
+            samples = self._samples
+            frame = frames().get(self._thread)
+            if samples is not None and frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                                            code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                samples[';'.join(stack)] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _save(self, turn, turnTime, message, summary, profileText, stats):
+        try:
+            name = "%s-turn%06d-%dms" % (time.strftime("%Y%m%d-%H%M%S"), turn,
+                                         int(turnTime * 1000))
+            path = os.path.join(self.directory, name)
+            os.makedirs(path)
+            with open(os.path.join(path, "status.xml"), "wb") as out:
+                out.write(message if isinstance(message, bytes) else message.encode('utf-8'))
+            with open(os.path.join(path, "brain.txt"), "w") as out:
+                out.write("turn %d took %.6f seconds (threshold %.3f)\n\n" %
+                          (turn, turnTime, self.threshold))
+                out.write(summary)
+            if profileText is not None:
+                with open(os.path.join(path, "samples.txt"), "w") as out:
+                    out.write(profileText)
+            if stats is not None:
+                import pstats
+                stats.dump_stats(os.path.join(path, "turn.prof"))
+                with open(os.path.join(path, "profile.txt"), "w") as out:
+                    pstats.Stats(stats, stream=out).sort_stats('cumulative').print_stats(40)
+            self.captures += 1
+            self._rotate()
+        except Exception as e:
+            printrap("Could not save slow turn capture: %r" % e)
+
+    def _rotate(self):
+        captures = sorted(d for d in os.listdir(self.directory)
+                          if os.path.isdir(os.path.join(self.directory, d)))
+        for old in captures[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+
+
+def formatSamples(samples, interval):
+    """Return stack samples as text: a per-function summary, then collapsed
+    stacks (one "frame;frame;frame count" per line, flamegraph.pl format)."""
+    total = sum(samples.values())
+    selfCounts = defaultdict(int)
+    for stack, count in samples.items():
+        selfCounts[stack.rsplit(';', 1)[-1]] += count
+    lines = ["%d samples, %.1f ms apart" % (total, interval * 1000), "",
+             "%8s %6s  %s" % ("samples", "self%", "function")]
+    for func, count in sorted(selfCounts.items(), key=lambda x: -x[1]):
+        lines.append("%8d %5.1f%%  %s" % (count, 100 * count / max(total, 1), func))
+    lines.append("")
+    for stack, count in sorted(samples.items(), key=lambda x: -x[1]):
+        lines.append("%s %d" % (stack, count))
+    return '\n'.join(lines) + '\n'
+
+def summarizeBrain(brain):
+    """Return a short text description of the brain's view of the game."""
+    lines = []
+    me = getattr(brain, 'me', None)
+    if me is not None:
+        lines.append("me: %s" % me)
+        lines.append("limo: %s" % me.limo)
+        lines.append("path: %r" % (list(me.limo.path),))
+        lines.append("pickup: %r" % (me.pickup,))
+    for player in getattr(brain, 'players', None) or []:
+        lines.append("player %s score=%r limo=%s" % (player.name, player.score, player.limo))
+    for company in getattr(brain, 'companies', None) or []:
+        lines.append("company %s waiting=%r" % (company, company.passengers))
+    for psngr in getattr(brain, 'passengers', None) or []:
+        lines.append("passenger %s lobby=%s dest=%s car=%s enemies=%r" %
+                     (psngr.name, psngr.lobby and psngr.lobby.name,
+                      psngr.destination and psngr.destination.name,
+                      psngr.car is not None, psngr.enemies))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,124 @@
+"""
+Module reconnect: gets us back on the server after the connection drops,
+without holding up the thread that noticed.
+
+Reconnector(connect) -- call lost() when the connection goes; a background
+    thread calls connect() until it succeeds, waiting a capped, jittered,
+    exponentially growing delay between failures. Call resumed() when the
+    server confirms us on the new connection.
+
+The first attempt after an outage is made at once, so a blip costs one
+connect. After that attempt n waits a random time between half and all of
+min(BACKOFF_CAP, BACKOFF_FIRST * 2 ** n) - the jitter keeps a room full of
+clients that lost the server together from all hammering it in step.
+
+Only one reconnect runs at a time; losses reported while it runs are counted
+and dropped. The backoff is only reset by resumed(), so a connection that
+drops again before the server has confirmed us picks up where the backoff
+left off rather than starting a new burst of immediate retries.
+
+The time from losing the connection to resumed() is recorded in the
+instrument histogram "resume".
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import random, threading
+
+import instrument
+from debug import log
+
+BACKOFF_FIRST = .1
+"""Seconds of the first wait between failed attempts."""
+BACKOFF_CAP = 5.0
+"""Most seconds to wait between attempts."""
+
+
+class Reconnector(object):
+    """Reconnects on a background thread with capped exponential backoff."""
+
+    def __init__(self, connect, first=BACKOFF_FIRST, cap=BACKOFF_CAP, rand=None):
+        """connect -- Makes one attempt to connect; raises if it fails.
+        first -- Seconds of the first wait between attempts.
+        cap -- Most seconds to wait between attempts.
+        rand -- random.Random for the jitter.
+        attempt -- Attempts made since the server last confirmed us.
+        outages -- Number of times the connection was lost.
+        coalesced -- Losses reported while already reconnecting (ignored).
+        failures -- Connection attempts that failed.
+        lostAt -- instrument.wallClock() when the connection was lost, or
+            None if we are not waiting to resume.
+
+        """
+        self.connect = connect
+        self.first = first
+        self.cap = cap
+        self.rand = random.Random() if rand is None else rand
+        self.attempt = 0
+        self.outages = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.lostAt = None
+        self._lock = threading.Lock()
+        self._active = False
+        self._stop = threading.Event()
+
+    def delay(self, attempt):
+        """Seconds to wait before attempt (0 for the first)."""
+        if attempt <= 0:
+            return 0.0
+        ceiling = min(self.cap, self.first * 2 ** (attempt - 1))
+        return self.rand.uniform(ceiling / 2, ceiling)
+
+    def lost(self, err=None):
+        """The connection is gone. Returns False if a reconnect was already
+        running (this loss is folded into it)."""
+        with self._lock:
+            if self._active:
+                self.coalesced += 1
+                return False
+            self._active = True
+            self.outages += 1
+            if self.lostAt is None:
+                self.lostAt = instrument.wallClock()
+        thread = threading.Thread(target=self._run, name="Reconnector")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def resumed(self):
+        """The server has confirmed us. Returns seconds since the connection
+        was lost, or None if we were not reconnecting."""
+        with self._lock:
+            lostAt, self.lostAt = self.lostAt, None
+            self.attempt = 0
+        if lostAt is None:
+            return None
+        seconds = instrument.wallClock() - lostAt
+        instrument.record('resume', seconds)
+        log.info("Resumed %.3f seconds after the connection was lost", seconds)
+        return seconds
+
+    def close(self):
+        """Stop trying."""
+        self._stop.set()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                wait = self.delay(self.attempt)
+                if wait and self._stop.wait(wait):
+                    return
+                self.attempt += 1
+                try:
+                    self.connect()
+                    log.info("Re-connected (attempt %d)", self.attempt)
+                    return
+                except Exception as e:
+                    self.failures += 1
+                    log.warning("Re-connection failed! Exception: %r", e)
+        finally:
+            with self._lock:
+                self._active = False
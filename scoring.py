@@ -0,0 +1,125 @@
+"""
+Module scoring: ranks passenger candidates in one pass over parallel arrays
+instead of one Python call per passenger.
+
+    batch = Candidates(len(passengers))
+    batch.points[i] = ...; batch.free[i] = ...; ...   # facts per passenger
+    masks(batch)               # eligible and preferred, for all at once
+    for i in chosen(batch):
+        batch.toPassenger[i] = ...; batch.toDestination[i] = ...
+    order = rank(batch)        # indexes, best first
+
+masks() combines the per-candidate facts (free, placed, delivered, riding,
+refuses) into the eligible and preferred masks in one operation over the
+arrays. A candidate's score is 100 * points / (toPassenger + toDestination)
+- points per tile of the trip. rank() keeps the eligible candidates (and only the
+preferred ones among them, if any are) and orders them by score, highest
+first; equal scores keep their index order, as sorted() does.
+
+With NumPy installed the arrays are viewed in place (no copy), the masks
+are combined with whole-array operations and the chosen candidates are
+scored and sorted as whole arrays. Without it (or with WINDWARD_NUMPY=0)
+the same is done over the array module's arrays in plain Python - the same
+ranking, just slower for many passengers.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os
+from array import array
+try:
+    import numpy
+except ImportError: # optional
+    numpy = None
+
+USE_NUMPY = numpy is not None and os.environ.get("WINDWARD_NUMPY", "1") != "0"
+
+
+class Candidates(object):
+    """Parallel arrays, one entry per candidate passenger."""
+
+    def __init__(self, size):
+        """size -- Number of candidates.
+        points -- array of the points each would score.
+        toPassenger -- array of the path length from us to their lobby.
+        toDestination -- array of the path length from their lobby to
+            their destination.
+        free -- bytearray, 1 if they are in no limo.
+        placed -- bytearray, 1 if they have a lobby and a destination.
+        delivered -- bytearray, 1 if we have delivered them already.
+        riding -- bytearray, 1 if they are our passenger now.
+        refuses -- bytearray, 1 if they would not get out at their
+            destination (an enemy of theirs is waiting there).
+        eligible -- bytearray, 1 if they may be picked up at all (see masks).
+        preferred -- bytearray, 1 if they are eligible and would also get
+            out at their destination (see masks).
+
+        """
+        self.size = size
+        self.points = array('d', [0.0]) * size
+        self.toPassenger = array('d', [0.0]) * size
+        self.toDestination = array('d', [0.0]) * size
+        self.free = bytearray(size)
+        self.placed = bytearray(size)
+        self.delivered = bytearray(size)
+        self.riding = bytearray(size)
+        self.refuses = bytearray(size)
+        self.eligible = bytearray(size)
+        self.preferred = bytearray(size)
+
+
+def masks(batch):
+    """Fill in batch.eligible (free, placed, not delivered and not riding)
+    and batch.preferred (eligible and not refusing) from the facts."""
+    if USE_NUMPY and batch.size:
+        def view(a):
+            return numpy.frombuffer(a, dtype=numpy.uint8)
+        eligible = view(batch.free) & view(batch.placed) & ~(view(batch.delivered) | view(batch.riding))
+        view(batch.eligible)[:] = eligible
+        view(batch.preferred)[:] = eligible & (view(batch.refuses) ^ 1)
+        return
+    batch.eligible[:] = bytearray([f & p & ((d | r) ^ 1) for f, p, d, r in
+                                   zip(batch.free, batch.placed, batch.delivered, batch.riding)])
+    batch.preferred[:] = bytearray([e & (r ^ 1) for e, r in zip(batch.eligible, batch.refuses)])
+
+
+def chosen(batch):
+    """Indexes of the candidates rank() will order: the eligible and
+    preferred ones, or if there are none the eligible ones. Only these need
+    their distances filled in."""
+    if USE_NUMPY and batch.size:
+        indexes = numpy.flatnonzero(numpy.frombuffer(batch.preferred, dtype=numpy.uint8))
+        if not len(indexes):
+            indexes = numpy.flatnonzero(numpy.frombuffer(batch.eligible, dtype=numpy.uint8))
+        return indexes.tolist()
+    preferred = batch.preferred
+    indexes = [i for i in range(batch.size) if preferred[i]]
+    if not indexes:
+        eligible = batch.eligible
+        indexes = [i for i in range(batch.size) if eligible[i]]
+    return indexes
+
+def rank(batch, indexes=None):
+    """chosen(batch) (or indexes), best score first."""
+    if indexes is None:
+        indexes = chosen(batch)
+    if USE_NUMPY and indexes:
+        indexes = numpy.array(indexes, dtype=numpy.intp)
+        points = numpy.frombuffer(batch.points, dtype=numpy.float64)[indexes]
+        length = (numpy.frombuffer(batch.toPassenger, dtype=numpy.float64)[indexes] +
+                  numpy.frombuffer(batch.toDestination, dtype=numpy.float64)[indexes])
+        # a stable sort of the negated scores keeps equal scores in index order
+        return indexes[numpy.argsort(-_score(points, length), kind='stable')].tolist()
+    points, toPassenger, toDestination = batch.points, batch.toPassenger, batch.toDestination
+    scores = dict((i, _score(points[i], toPassenger[i] + toDestination[i])) for i in indexes)
+    return sorted(indexes, key=scores.__getitem__, reverse=True)
+
+def score(batch, index):
+    """The score of one candidate."""
+    return _score(batch.points[index], batch.toPassenger[index] + batch.toDestination[index])
+
+def _score(points, length):
+    # points per tile of the trip - numbers or NumPy arrays alike
+    return 100 * points / length
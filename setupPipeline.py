@@ -0,0 +1,216 @@
+"""
+Module setupPipeline: precomputes distance tables between setup and our first
+order, spread over a process pool, without making us late with "ready".
+
+    tables = DistanceTables(gmap, [company.busStop for company in companies])
+    tables.start()
+    tables.wait(SETUP_DEADLINE)
+    ...
+    tables.distance((x, y), busStop)   # ticks, or None if not known yet
+
+There is one task per bus stop: a breadth-first search out from the stop
+over the driveable tiles (landmarks.distancesFrom), giving the number of ticks from every tile to that
+stop (roads are two-way, so to and from are the same). Each task fills its
+own row of one shared table (a multiprocessing.sharedctypes.RawArray handed
+to the workers when the pool starts), so no results are pickled back - a
+worker only says which row it finished.
+
+wait() returns at the deadline whether or not every row is done. The rest
+keep filling in the background, and a row can be used the moment it is done;
+until then distance() returns None and the caller falls back to searching.
+Stops are filled in the order given, so put the ones needed first first.
+
+Bots on the same map share the finished tables (see sharedTables.py): if
+another bot has published them, DistanceTables uses theirs and computes
+nothing.
+
+The pool's processes come from a forkserver (or are spawned), never forked
+from us: by setup we have threads running (the receiver, the log writer,
+metrics), and a fork taken while one of them holds a lock (logging's,
+instrument's) leaves that lock held for ever in the child. warmUp() starts
+the forkserver early, before those threads, so setup does not wait for it.
+
+Where a pool cannot be used - one core, no forkserver or spawn (Python 2),
+or we are already in a daemonic worker process (which may not have
+children) - the tasks run on a background thread instead. Set WINDWARD_SETUP_WORKERS to choose the number
+of processes (0 for the thread).
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os, threading, multiprocessing
+from multiprocessing import sharedctypes
+
+import instrument, sharedTables
+from debug import log
+from landmarks import driveableGrid, distancesFrom, UNREACHABLE, TYPECODE as TABLE_TYPE
+
+SETUP_DEADLINE = 1.0
+"""Most seconds setup waits for the tables before sending ready."""
+
+
+def fillRow(grid, table, width, height, row, stop):
+    """Write the ticks from each tile to stop into row of table
+    (UNREACHABLE where there is no way)."""
+    size = width * height
+    distances = distancesFrom(grid, width, height, stop[0] * height + stop[1])
+    table[row * size:(row + 1) * size] = distances.tolist()
+    return row
+
+# the shared buffers, in a pool worker (set by _startWorker)
+_worker = None
+
+def _startWorker(grid, table, width, height):
+    global _worker
+    # a private copy of the grid - reading a bytearray is far faster than
+    # reading a ctypes array
+    _worker = (bytearray(grid[:]), table, width, height)
+
+def _fillRowInWorker(row, stop):
+    grid, table, width, height = _worker
+    return fillRow(grid, table, width, height, row, stop)
+
+def context():
+    """The multiprocessing context the pool is made in (forkserver, else
+    spawn), or None if there is neither."""
+    getContext = getattr(multiprocessing, 'get_context', None)
+    if getContext is None:
+        return None # Python 2 can only fork
+    methods = multiprocessing.get_all_start_methods()
+    for method in ('forkserver', 'spawn'):
+        if method in methods:
+            return getContext(method)
+    return None
+
+def warmUp():
+    """Start the forkserver now (call before starting any threads), so the
+    first pool does not wait for it."""
+    ctx = context()
+    if ctx is None or ctx.get_start_method() != 'forkserver' or poolSize() == 0:
+        return
+    # the workers run the main script again; with the bot's modules already
+    # in the forkserver that is only a few lookups. (Preloading '__main__'
+    # itself does nothing on some Pythons.)
+    ctx.set_forkserver_preload(['myPlayerBrain', 'setupPipeline'])
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
+
+def poolSize():
+    """Processes to use for the tables - 0 to use a thread instead."""
+    workers = os.environ.get("WINDWARD_SETUP_WORKERS")
+    if workers is not None:
+        return int(workers) if context() is not None else 0
+    if context() is None:
+        return 0 # no safe way to start processes
+    if multiprocessing.current_process().daemon:
+        return 0 # daemonic processes are not allowed to have children
+    cpus = multiprocessing.cpu_count()
+    return cpus if cpus > 1 else 0
+
+
+class DistanceTables(object):
+    """Ticks from every tile to each of a list of bus stops, filled in the
+    background."""
+
+    def __init__(self, gmap, stops, workers=None):
+        """gmap -- The game map.
+        stops -- The bus stops (tiles) to build tables for, most wanted first.
+        workers -- Processes to fill them with (see poolSize; 0 for a thread).
+        grid -- driveableGrid(gmap); sharedGrid is a shared copy for the pool.
+        rows -- {stop: row of the table}.
+        ready -- bytearray, 1 for each row that is done.
+        table -- The shared table: row * width * height + x * height + y.
+        shared -- True if another bot on this map made the table (see
+            sharedTables.py); it is used as is and there is nothing to start.
+
+        """
+        self.width = gmap.width
+        self.height = gmap.height
+        self.stops = list(stops)
+        self.rows = dict((stop, row) for row, stop in enumerate(self.stops))
+        self.workers = poolSize() if workers is None else workers
+        self.ready = bytearray(len(self.stops))
+        self.done = 0
+        size = self.width * self.height
+        self.grid = driveableGrid(gmap)
+        self._key = sharedTables.tableKey("stops", self.grid, self.width, self.height,
+                                          self.stops)
+        found = sharedTables.attach(self._key)
+        self.shared = found is not None
+        if self.shared:
+            self.sharedGrid = None
+            self.table = found[1]
+            self.ready = bytearray([1]) * len(self.stops)
+            self.done = len(self.stops)
+        else:
+            self.sharedGrid = sharedctypes.RawArray('b', list(self.grid))
+            self.table = sharedctypes.RawArray(TABLE_TYPE, len(self.stops) * size)
+        self._pool = None
+        self._finished = threading.Event()
+        self._started = None
+
+    def start(self):
+        """Start filling the tables. Returns at once."""
+        self._started = instrument.wallClock()
+        if not self.stops or self.shared:
+            self._finished.set()
+            return
+        if self.workers > 0:
+            try:
+                self._pool = context().Pool(
+                    self.workers, _startWorker,
+                    (self.sharedGrid, self.table, self.width, self.height))
+            except (OSError, AssertionError) as e:
+                log.warning("No process pool for the distance tables (%r) - using a thread", e)
+                self._pool = None
+        if self._pool is not None:
+            for row, stop in enumerate(self.stops):
+                self._pool.apply_async(_fillRowInWorker, (row, stop),
+                                       callback=self._rowDone)
+            self._pool.close()
+        else:
+            thread = threading.Thread(target=self._fillAll, name="DistanceTables")
+            thread.daemon = True
+            thread.start()
+
+    def wait(self, timeout=None):
+        """Wait until every table is done or timeout seconds have passed.
+        Returns True if they are all done."""
+        finished = self._finished.wait(timeout)
+        log.info("Distance tables: %d of %d ready after %.3f seconds",
+                 self.done, len(self.stops), instrument.wallClock() - self._started)
+        return bool(finished)
+
+    def isComplete(self):
+        return self.done == len(self.stops)
+
+    def distance(self, tile, stop):
+        """Ticks from tile to the bus stop stop, or None if that table is not
+        done yet (or stop has none). UNREACHABLE if there is no way."""
+        row = self.rows.get(stop)
+        if row is None or not self.ready[row]:
+            return None
+        return self.table[(row * self.width + tile[0]) * self.height + tile[1]]
+
+    def close(self):
+        """Stop filling the tables (any not done stay not done)."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self._finished.set()
+
+    def _fillAll(self):
+        for row, stop in enumerate(self.stops):
+            if self._finished.is_set():
+                return
+            self._rowDone(fillRow(self.grid, self.table, self.width, self.height, row, stop))
+
+    def _rowDone(self, row):
+        self.ready[row] = 1
+        self.done += 1
+        if self.done == len(self.stops):
+            instrument.record('distanceTables', instrument.wallClock() - self._started)
+            self._finished.set()
+            sharedTables.publish(self._key, [len(self.stops)], self.table)
@@ -0,0 +1,144 @@
+"""
+Module sharedTables: read-only tables computed once per map and shared by
+every bot on the machine, through memory-mapped files.
+
+    key = tableKey("landmarks", grid, width, height, COUNT)
+    found = attach(key)              # (header, table) or None
+    if found is None:
+        ... compute table ...
+        publish(key, header, table)
+
+Landmark tables (landmarks.py) and bus stop distance tables (setupPipeline)
+depend only on the map, so when several bots play on the same map - a
+tournament's bots, or several teams' bots on one host - they all compute the
+same ones. With sharing on, the first bot to finish a table writes it to
+DIRECTORY under a name made from a hash of the map (and whatever else the
+table depends on); the others map that file read-only and use it in place.
+
+publish() writes to a temporary file and renames it into place, so a reader
+sees a whole file or none. attach() maps the file and returns a memoryview
+of the table: on Python 3 it is cast to 2-byte ints and indexes like the
+array it replaces without copying anything - every process shares the
+same pages of the page cache. Python 2 can neither view an mmap nor cast a
+memoryview, so there the file is read into an array (still no
+recomputing). The last KEEP tables attached or published in this process
+are kept, so bots in one process share one mapping; older ones are
+forgotten and their mappings closed (or, if a table is still in use, unmapped
+once the last user lets go), so a process playing game after game on new
+maps does not grow.
+
+Sharing is off unless WINDWARD_SHARED_DIR names a directory to use
+(tournament.py sets one up for its games).
+
+File layout: MAGIC, the number of header ints and the header ints (int32,
+little-endian), then the table (int16, in this machine's byte order - the
+files are only for this machine).
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import os, sys, mmap, struct, hashlib, tempfile, threading
+from array import array
+from collections import OrderedDict
+
+from debug import log
+
+DIRECTORY = os.environ.get("WINDWARD_SHARED_DIR") or None
+"""Where the shared tables are, None to not share."""
+MAGIC = b'WWT1'
+TYPECODE = 'h'
+KEEP = 4
+"""Tables kept attached in this process (a map has two)."""
+
+# key -> (header, table, mmap or None) attached or published by this
+# process, least recently used first
+_attached = OrderedDict()
+_lock = threading.Lock()
+
+
+def tableKey(kind, grid, *parts):
+    """A file name for the table kind of the map with driveable grid (a
+    bytearray, see landmarks.driveableGrid) that also depends on parts."""
+    digest = hashlib.sha1(bytes(grid))
+    digest.update(repr(parts).encode('ascii'))
+    return "%s-%s.bin" % (kind, digest.hexdigest())
+
+def attach(key):
+    """(header ints, table) for key if it has been published, else None."""
+    if DIRECTORY is None:
+        return None
+    with _lock:
+        found = _attached.pop(key, None)
+        if found is not None:
+            _attached[key] = found # now the most recently used
+            return found[:2]
+        mapped = None
+        try:
+            with open(os.path.join(DIRECTORY, key), 'rb') as f:
+                if sys.version_info[0] >= 3:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    view = memoryview(mapped)
+                else:
+                    view = memoryview(f.read()) # Python 2 cannot view an mmap
+        except (IOError, OSError, ValueError):
+            return None # not published (yet), or empty
+        if len(view) < 8 or view[:4].tobytes() != MAGIC:
+            log.warning("Ignoring shared table %r - not one of ours", key)
+            view = None
+            _close(mapped)
+            return None
+        count = struct.unpack('<i', view[4:8].tobytes())[0]
+        start = 8 + 4 * count
+        header = struct.unpack('<%di' % count, view[8:start].tobytes())
+        if sys.version_info[0] >= 3:
+            table = view[start:].cast(TYPECODE)
+        else:
+            table = array(TYPECODE, view[start:].tobytes()) # no cast in Python 2
+        _keep(key, (header, table, mapped))
+        return header, table
+
+def publish(key, header, table):
+    """Share table (a sequence of ints fitting TYPECODE) under key, with a
+    few ints of header. Returns True if it was written."""
+    if DIRECTORY is None:
+        return False
+    data = array(TYPECODE, table)
+    header = tuple(header)
+    try:
+        if not os.path.isdir(DIRECTORY):
+            os.makedirs(DIRECTORY)
+        handle, temporary = tempfile.mkstemp(dir=DIRECTORY, suffix=".tmp")
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<%di' % (len(header) + 1), len(header), *header))
+                f.write(data.tostring() if sys.version_info[0] < 3 else data.tobytes())
+            os.rename(temporary, os.path.join(DIRECTORY, key)) # atomic
+        except Exception:
+            os.remove(temporary)
+            raise
+    except (IOError, OSError) as e:
+        log.warning("Could not share table %r: %r", key, e)
+        return False
+    with _lock:
+        if key not in _attached:
+            _keep(key, (header, data, None))
+    return True
+
+def _keep(key, entry):
+    """Remember entry as the most recently used, forgetting the oldest beyond
+    KEEP. Call holding _lock."""
+    _attached[key] = entry
+    while len(_attached) > KEEP:
+        _close(_attached.popitem(last=False)[1][2])
+
+def _close(mapped):
+    """Close an mmap if nothing still views it. If something does, it is
+    unmapped when the last view goes."""
+    if mapped is not None:
+        try:
+            mapped.close()
+        except BufferError:
+            pass # a table from it is still in use
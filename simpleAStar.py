@@ -21,13 +21,43 @@ from __future__ import division
 from __future__ import print_function
 
 import time
+import instrument
+from api.path import Path
 from debug import trap, printrap, bugprint
 
 OFFSETS = ( (-1, 0), (1, 0), (0, -1), (0, 1) )
 DEAD_END = 10000
 POINT_OFF_MAP = (-1, -1)
 
-def calculatePath(gmap, start, end):
+# totals over every search, for comparing heuristics
+searches = 0
+expansions = 0
+
+# TrailPoints of finished searches, emptied, for later searches to reuse -
+# a search then allocates (and leaves for the garbage collector) almost nothing
+_spare = []
+SPARE_MAX = 8192
+
+def _trailPoint(point, end, cost, heuristic, made):
+    try:
+        tp = _spare.pop()
+    except IndexError:
+        tp = TrailPoint(point, end, cost, heuristic)
+    else:
+        tp.reset(point, end, cost, heuristic)
+    made.append(tp)
+    return tp
+
+def _release(made):
+    """Give the TrailPoints of a finished search back for reuse."""
+    for tp in made:
+        del tp.neighbors[:] # they point at each other - break the cycles
+    room = SPARE_MAX - len(_spare)
+    if room > 0:
+        _spare.extend(made[:room])
+
+@instrument.timed('pathSearch')
+def calculatePath(gmap, start, end, heuristic=None):
     """Calculate and return a path from start to end.
 
     This implementation is intentionally stupid and is NOT guaranteed in any
@@ -42,131 +72,160 @@ def calculatePath(gmap, start, end):
     map -- The game map.
     start -- The tile units of the start point (inclusive).
     end -- The tile units of the end point (inclusive).
+    heuristic -- function tile -> estimated distance to end. By default
+        Manhattan distance. This search is not a true A*, so a tighter
+        estimate (gmap.landmarks.heuristic(end)) can give longer paths.
 
     """
+    global searches, expansions
     # should never happen but just to be sure
     if start == end:
-        return [start]
+        return Path([start])
+
+    expanded = 0
 
     # nodes are points we have walked to
     nodes = {}
     # points we have in a trailPoint, but not yet evaluated
     notEvaluated = []
-
-    tpOn = TrailPoint(start, end, 0)
-    while True:
-        nodes[tpOn.mapTile] = tpOn
-
-        # get the neighbors
-        tpClosest = None
-        for ptOffset in OFFSETS:
-            pointNeighbor = (tpOn.mapTile[0] + ptOffset[0], tpOn.mapTile[1] + ptOffset[1])
-            square = gmap.squareOrDefault(pointNeighbor)
-            # off the map or not a road/bus stop
-            if square is None or (not square.isDriveable()):
-                continue
-            # already evaluated - add it in
-            if pointNeighbor in nodes:
-                tpAlreadyEvaluated = nodes[pointNeighbor]
-                tpAlreadyEvaluated.cost = min(tpAlreadyEvaluated.cost, tpOn.cost+1)
-                tpOn.neighbors.append(tpAlreadyEvaluated)
-                continue
-
-            # add this one in
-            tpNeighbor = TrailPoint(pointNeighbor, end, tpOn.cost+1)
-            tpOn.neighbors.append(tpNeighbor)
-            # may already be in notEvaluated. If so remove it as this is a more
-            # recent cost estimate.
-            if tpNeighbor in notEvaluated:
-                notEvaluated.remove(tpNeighbor)
-
-            # we only assign to tpClosest if it is closer to the destination.
-            # If it's further away, then we use notEvaluated below to find the
-            # one closest to the dest that we ahve not walked yet.
-            if tpClosest is None:
-                if tpNeighbor.distance < tpOn.distance:
-                    # new neighbor is closer - work from this next
-                    tpClosest = tpNeighbor
-                else:
-                    # this is further away - put in the list to try if a
-                    # better route is not found
-                    notEvaluated.append(tpNeighbor)
-            else:
-                if tpClosest.distance <= tpNeighbor.distance:
-                    # this is further away - put in the list to try if a
-                    # better route is not found
-                    notEvaluated.append(tpNeighbor)
+    # every TrailPoint of this search, to release when done - however the
+    # search ends
+    made = []
+
+    try:
+        tpOn = _trailPoint(start, end, 0, heuristic, made)
+        while True:
+            nodes[tpOn.mapTile] = tpOn
+            expanded += 1
+
+            # get the neighbors
+            tpClosest = None
+            for ptOffset in OFFSETS:
+                pointNeighbor = (tpOn.mapTile[0] + ptOffset[0], tpOn.mapTile[1] + ptOffset[1])
+                square = gmap.squareOrDefault(pointNeighbor)
+                # off the map or not a road/bus stop
+                if square is None or (not square.isDriveable()):
+                    continue
+                # already evaluated - add it in
+                if pointNeighbor in nodes:
+                    tpAlreadyEvaluated = nodes[pointNeighbor]
+                    tpAlreadyEvaluated.cost = min(tpAlreadyEvaluated.cost, tpOn.cost+1)
+                    tpOn.neighbors.append(tpAlreadyEvaluated)
+                    continue
+
+                # add this one in
+                tpNeighbor = _trailPoint(pointNeighbor, end, tpOn.cost+1, heuristic, made)
+                tpOn.neighbors.append(tpNeighbor)
+                # may already be in notEvaluated. If so remove it as this is a more
+                # recent cost estimate.
+                if tpNeighbor in notEvaluated:
+                    notEvaluated.remove(tpNeighbor)
+
+                # we only assign to tpClosest if it is closer to the destination.
+                # If it's further away, then we use notEvaluated below to find the
+                # one closest to the dest that we ahve not walked yet.
+                if tpClosest is None:
+                    if tpNeighbor.distance < tpOn.distance:
+                        # new neighbor is closer - work from this next
+                        tpClosest = tpNeighbor
+                    else:
+                        # this is further away - put in the list to try if a
+                        # better route is not found
+                        notEvaluated.append(tpNeighbor)
                 else:
-                    # this is closer than tpOn and another neighbor - use it next.
-                    notEvaluated.append(tpClosest)
-                    tpClosest = tpNeighbor
-        # re-calc based on neighbors
-        tpOn.recalculateDistance(POINT_OFF_MAP, gmap.width)
-
-        # if no closest, then get from notEvaluated. This is where it
-        # guarantees that we are getting the shortest route - we go in here
-        # if the above did not move a step closer. This may not either as
-        # the best choice may be the neighbor we didn't go with above - but
-        # we drop into this to find the closest based on what we know.
-        if tpClosest is None:
-            if len(notEvaluated) == 0:
+                    if tpClosest.distance <= tpNeighbor.distance:
+                        # this is further away - put in the list to try if a
+                        # better route is not found
+                        notEvaluated.append(tpNeighbor)
+                    else:
+                        # this is closer than tpOn and another neighbor - use it next.
+                        notEvaluated.append(tpClosest)
+                        tpClosest = tpNeighbor
+            # re-calc based on neighbors
+            tpOn.recalculateDistance(POINT_OFF_MAP, gmap.width)
+
+            # if no closest, then get from notEvaluated. This is where it
+            # guarantees that we are getting the shortest route - we go in here
+            # if the above did not move a step closer. This may not either as
+            # the best choice may be the neighbor we didn't go with above - but
+            # we drop into this to find the closest based on what we know.
+            if tpClosest is None:
+                if len(notEvaluated) == 0:
+                    trap()
+                    break
+                # we need the closest one as that's how we find the shortest path
+                tpClosest = notEvaluated[0]
+                for tpNotEval in notEvaluated:
+                    if tpNotEval.distance < tpClosest.distance:
+                        tpClosest = tpNotEval
+                notEvaluated.remove(tpClosest)
+
+            # if we're at the end - we're done!
+            if tpClosest.mapTile == end:
+                tpClosest.neighbors.append(tpOn)
+                nodes[tpClosest.mapTile] = tpClosest
+                break
+
+            # try this one next
+            tpOn = tpClosest
+
+        searches += 1
+        expansions += expanded
+
+        # create the return path - from end back to beginning, then reversed
+        tpOn = nodes[end]
+        path = Path([tpOn.mapTile])
+        ids = path.ids
+        while tpOn.mapTile != start:
+            neighbors = tpOn.neighbors
+            cost = tpOn.cost
+
+            tpOn = min(neighbors, key=lambda n: n.cost)
+
+            # we didn't get to the start.
+            if tpOn.cost >= cost:
                 trap()
                 break
-            # we need the closest one as that's how we find the shortest path
-            tpClosest = notEvaluated[0]
-            for tpNotEval in notEvaluated:
-                if tpNotEval.distance < tpClosest.distance:
-                    tpClosest = tpNotEval
-            notEvaluated.remove(tpClosest)
-
-        # if we're at the end - we're done!
-        if tpClosest.mapTile == end:
-            tpClosest.neighbors.append(tpOn)
-            nodes[tpClosest.mapTile] = tpClosest
-            break
-
-        # try this one next
-        tpOn = tpClosest
-
-    # create the return path - from end back to beginning
-    tpOn = nodes[end]
-    path = [tpOn.mapTile]
-    while tpOn.mapTile != start:
-        neighbors = tpOn.neighbors
-        cost = tpOn.cost
-
-        tpOn = min(neighbors, key=lambda n: n.cost)
-
-        # we didn't get to the start.
-        if tpOn.cost >= cost:
-            trap()
-            return path
-        else:
-            path.insert(0, tpOn.mapTile)
+            else:
+                ids.append(tpOn.mapTile[0] << 16 | tpOn.mapTile[1])
 
-    return path
+        ids.reverse()
+        return path
+    finally:
+        _release(made)
 
 class TrailPoint(object):
-    def __init__(self, point, end, cost):
+    __slots__ = ('mapTile', 'neighbors', 'distance', 'cost')
+
+    def __init__(self, point, end, cost, heuristic=None):
         """A point in a car's path.
 
         mapTile -- The map tile (a 2-tuple) for this point in the trail.
         neighbors -- A list of the neighboring tiles (up to 4). If 0 then this
             point has been added as a neighbor but is in the notEvaluated list
             because it has not yet been tried.
-        distance -- Estimate of the distance from mapTile to the end. Manhattan
-            distance if have no neighbors, best neighbor.distance + 1 otherwise.
+        distance -- Estimate of the distance from mapTile to the end.
+            heuristic(mapTile) (Manhattan distance if there is no heuristic)
+            if have no neighbors, best neighbor.distance + 1 otherwise.
             This value is bad if it's along a trail that failed.
 
         """
-        self.mapTile = point
         self.neighbors = []
-        self.distance = abs(point[0] - end[0]) + abs(point[1] - end[1])
+        self.reset(point, end, cost, heuristic)
+
+    def reset(self, point, end, cost, heuristic=None):
+        """Make this (a TrailPoint with no neighbors) a new point."""
+        self.mapTile = point
+        if heuristic is None:
+            self.distance = abs(point[0] - end[0]) + abs(point[1] - end[1])
+        else:
+            self.distance = heuristic(point)
         self.cost = cost
 
     def recalculateDistance(self, mapTileCaller, remainingSteps):
         neighbors = self.neighbors
-        trap(self.distance == 0)
+        if __debug__:
+            trap(self.distance == 0)
         # if no neighbors then this is in notEvaluated and so can't recalculate.
         if len(neighbors) == 0:
             return
@@ -0,0 +1,168 @@
+"""
+Module simulator: plays games headless, in-process, calling the brains
+directly - no sockets, no status XML - as fast as the CPU allows.
+
+    python simulator.py --games 1000 --players 4
+
+The rules are localServer.Game. The brains are handed the game's own api
+objects (Map, Players, Companies, Passengers) in setup, so there is nothing
+to parse or update between ticks: each status is a call to the brain's
+statusChanged (with the api.units.ChangeSet of the tick, as the framework
+does) and then gameStatus. Between ticks each brain's idle is called until it
+has nothing more to do, and garbage is collected (gcControl.py), as the
+framework does while waiting for messages (it is not counted in the
+latencies). Orders go through framework.sendOrders as usual;
+the client the brain is given reads them back off the brain's Player rather
+than parsing the message.
+
+playGame(spec) takes and returns the same dicts as tournament.playGame, so
+tournament.py --headless plays its games here.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import sys, time, argparse
+
+import instrument, localServer, orders, tournament, gcControl
+from api import units
+
+
+class OrderClient(object):
+    """Stands in for tcpClient.TcpClient. sendOrders has already stored the
+    orders on the brain's Player (which is the game's), so they are passed
+    on to the game from there."""
+
+    def __init__(self, game, player):
+        self.game = game
+        self.player = player
+        self.messagesSent = 0
+        self.bytesSent = 0
+
+    def sendMessage(self, message):
+        self.messagesSent += 1
+        self.bytesSent += len(message)
+        self.game.setOrders(self.player, self.player.limo.path, self.player.pickup)
+
+    def close(self):
+        pass
+
+
+class Simulator(object):
+    """Plays a localServer.Game with brains, calling them directly."""
+
+    def __init__(self, setup, brains):
+        """setup -- The <setup> element (see localServer.generateSetup).
+        brains -- One brain (e.g. MyPlayerBrain) per player in setup, in order.
+        latencies -- {guid: [seconds each brain call took]}.
+        messages -- Number of statuses given to brains.
+        errors -- Number of brain calls that raised an exception. As with the
+            framework, the game goes on without that brain's orders.
+
+        """
+        self.game = localServer.Game(setup)
+        self.brains = brains
+        self.clients = [OrderClient(self.game, p) for p in self.game.players]
+        self.latencies = dict((p.guid, []) for p in self.game.players)
+        self.messages = 0
+        self.errors = 0
+
+    def run(self, maxTicks):
+        """Set up the brains, then play until maxTicks or every passenger is
+        done. Returns the Game."""
+        game = self.game
+        for player, brain, client in zip(game.players, self.brains, self.clients):
+            start = instrument.wallClock()
+            brain.setup(game.map, player, game.players, game.companies,
+                        game.passengers, client)
+            self.latencies[player.guid].append(instrument.wallClock() - start)
+        gcControl.freeze()
+        noChanges = units.ChangeSet()
+        while game.ticks < maxTicks and not game.isOver():
+            events = game.step()
+            changes = game.changes
+            for status, about in events:
+                for player, brain in zip(game.players, self.brains):
+                    start = instrument.wallClock()
+                    try:
+                        with gcControl.turn():
+                            listener = getattr(brain, 'statusChanged', None)
+                            if listener is not None:
+                                listener(changes)
+                            brain.gameStatus(status, about, game.players, game.passengers)
+                    except Exception:
+                        self.errors += 1
+                    self.latencies[player.guid].append(instrument.wallClock() - start)
+                    self.messages += 1
+                # the rest of this tick's statuses change nothing more
+                changes = noChanges
+            # the time between ticks, for the brains that use it
+            for brain in self.brains:
+                idle = getattr(brain, 'idle', None)
+                try:
+                    while idle is not None and idle():
+                        pass
+                except Exception:
+                    self.errors += 1
+            while gcControl.collectIdle():
+                pass
+        return game
+
+
+def playGame(spec):
+    """Play one headless game. spec and the result are as tournament.playGame."""
+    import myPlayerBrain
+
+    configs = spec["configs"]
+    names = ["%s#%d" % (c["name"], seat) for seat, c in enumerate(configs)]
+    setup = localServer.generateSetup(spec["seed"], names)
+    brains = []
+    for name, config in zip(names, configs):
+        brain = myPlayerBrain.MyPlayerBrain(name)
+        for attr, value in config.get("attributes", {}).items():
+            setattr(brain, attr, value)
+        brains.append(brain)
+    sim = Simulator(setup, brains)
+
+    start = time.time()
+    game = sim.run(spec["ticks"])
+    elapsed = time.time() - start
+    result = tournament.gameResult(spec, game, sim.clients, sim.latencies,
+                                   sim.messages, elapsed)
+    result["errors"] = sim.errors
+    return result
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Play headless games in this process.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=1500, help="most ticks per game")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first game")
+    args = parser.parse_args(argv)
+
+    specs = tournament.gameSpecs(args.games, args.players, [tournament.DEFAULT_CONFIG],
+                                 args.ticks, args.seed)
+    start = time.time()
+    results = [playGame(spec) for spec in specs]
+    elapsed = time.time() - start
+
+    ticks = sum(r["ticks"] for r in results)
+    messages = sum(r["messages"] for r in results)
+    scores = [b["score"] for r in results for b in r["bots"]]
+    mean = sum(scores) / len(scores)
+    stdev = (sum((s - mean) ** 2 for s in scores) / max(len(scores) - 1, 1)) ** .5
+    print("%d games, %d ticks, %d brain calls in %.1f seconds" %
+          (len(results), ticks, messages, elapsed))
+    print("%.2f games/s, %.0f ticks/s, %.0f brain calls/s" %
+          (len(results) / elapsed, ticks / elapsed, messages / elapsed))
+    print("score per seat: mean %.2f, stdev %.2f, standard error %.3f" %
+          (mean, stdev, stdev / len(scores) ** .5))
+    print("brain errors: %d" % sum(r["errors"] for r in results))
+    print(orders.stats.report())
+    print()
+    instrument.dump()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
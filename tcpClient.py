@@ -8,14 +8,19 @@ No copyright claimed - do anything you want with this code.
 
 from __future__ import print_function
 
-import threading, time
+import threading, time, struct, errno
 import socket as sock
 from collections import deque
+import instrument
 from debug import trap, bugprint, printrap
 
 BUFFER_SIZE = 65536 * 4
 PORT = 1707
 
+# errors that mean the connection is gone (10053/10054 are Windows' numbers)
+CONNECTION_LOST = set([errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE,
+                       errno.ENOTCONN, errno.ESHUTDOWN, 10053, 10054])
+
 class TcpClient(threading.Thread):
     """Threaded socket wrapper that sends and receives data from the server."""
     
@@ -24,32 +29,46 @@ class TcpClient(threading.Thread):
         
         socket = sock.socket(sock.AF_INET, sock.SOCK_STREAM, sock.IPPROTO_TCP)
         bugprint(host, PORT)
-        socket.connect( (host, PORT) )
+        try:
+            socket.connect( (host, PORT) )
+        except sock.error:
+            socket.close()
+            raise
         #socket.settimeout(.5)
         self.socket = socket
         
         self.receiver = Receiver( (host, PORT), socket, self )
         self.callback = callback
         self.running = True
+        # the last orders sent, to send again if we have to reconnect
+        self.lastMessage = None
     
     def run(self):
         bugprint("TcpClient running...")
         self.receiver.start()
         input = self.receiver.input
+        arrived = self.receiver.arrived
+        # callback.idle() is called while no message is waiting; it returns
+        # True if it did some work and would like to be called again.
+        idle = getattr(self.callback, 'idle', None)
         while self.running:
+            arrived.clear()
             if len(input):
-               self.callback.incomingMessage(input.popleft())
-#           time.sleep(.25)
+                self.callback.incomingMessage(input.popleft())
+            elif idle is None or not idle():
+                # nothing to do - sleep until the receiver has a message
+                arrived.wait()
         self.socket.close()
     
-    def sendMessage(self, message):
+    def sendMessage(self, message, remember=True):
+        # the socket takes bytes - messages are UTF-8 on the wire
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+        if remember:
+            self.lastMessage = message
         # compute the length of the message (4 byte, little-endian)
         length = len(message)
-        hexlen = "{:08x}".format(length)
-        assert len(hexlen) == 8 # length should not be more than 4 bytes
-        chrstr = [chr(int(hexlen[i:i+2], 16)) for i in range(0, 8, 2)]
-        chrstr.reverse()
-        retlen = ''.join(chrstr)
+        retlen = struct.pack('<I', length)
         try:
             #send the length
             self.socket.send(retlen) # fix this
@@ -61,14 +80,28 @@ class TcpClient(threading.Thread):
             assert ret == length
         except sock.timeout: # fix this
             printrap("Socket operation (send) timed out")
-            self.sendMessage(message)
+            self.sendMessage(message, remember)
+        except sock.error as err:
+            if err.errno not in CONNECTION_LOST:
+                raise
+            # the orders are remembered and go again once we are back
+            self.connectionLost(err)
         
     def connectionLost(self, err):
-        self.callback.connectionLost(err)
+        # tell the framework once, and not at all if we were closed on purpose
+        if self.running:
+            self.close()
+            self.callback.connectionLost(err, self)
     
     def close(self):
         self.receiver.running = False
         self.running = False
+        self.receiver.arrived.set() # wake run() so it sees we are done
+        try:
+            # wakes the receiver if it is waiting in recv()
+            self.socket.shutdown(sock.SHUT_RDWR)
+        except sock.error:
+            pass
     
  
 class Receiver(threading.Thread):
@@ -79,6 +112,7 @@ class Receiver(threading.Thread):
         self.callback = callback
         self.socket = socket
         self.input = deque()
+        self.arrived = threading.Event() # set when a message is put in input
         self.running = True
     
     def run(self):
@@ -88,49 +122,65 @@ class Receiver(threading.Thread):
         
         while self.running:
             data = getData(socket, self)
-            while data is None:
-                data = getData(socket, self)
-            end = data.rfind('>')
+            if data is None:
+                continue # timed out, or the connection is gone
+            end = data.rfind(b'>')
             assert end > 0
             data = data[:end+1] # strip ending nonsense C# bogus banana characters
+            if not isinstance(data, str):
+                data = data.decode('utf-8') # Python 3 - the rest of us use text
             input.append(data)
+            instrument.count('messages.received')
+            self.arrived.set()
         socket.close()
     
     def connectionLost(self, err):
+        self.running = False
         self.callback.connectionLost(err)
     
 
+def _receive(socket, length):
+    data = socket.recv(length)
+    if not data and length:
+        # the server closed the connection - recv() will return nothing forever
+        raise sock.error(errno.ECONNRESET, "Connection closed by the server")
+    return data
+
 def getData(socket, callback):
     try:
         # compute the length of the message (4 byte, little-endian)
-        recstr = socket.recv(4)
+        recstr = _receive(socket, 4)
         while len(recstr) < 4:
-            recstr += socket.recv(4 - len(recstr))
+            recstr += _receive(socket, 4 - len(recstr))
         assert len(recstr) == 4
-        lenstr = ["{:02x}".format(ord(char)) for char in recstr]
-        lenstr.reverse()
-        length = int(''.join(lenstr), 16)
+        length = struct.unpack('<I', recstr)[0]
         
-        # receive message into buffer
-        data = socket.recv(length)
+        # receive message into buffer - timed from the end of the header so
+        # the time spent waiting for the server to talk is not counted.
+        startWall = instrument.wallClock()
+        startCpu = instrument.cpuClock()
+        data = _receive(socket, length)
         received = len(data)
         buff = []
         while received < length:
             buff.append(data)
-            data = socket.recv(length - received)
+            data = _receive(socket, length - received)
             received += len(data)
         else:
             assert received == length
             if buff:
                 buff.append(data)
-                data = ''.join(buff)
+                data = b''.join(buff)
+        instrument.record('receive', instrument.wallClock() - startWall,
+                          instrument.cpuClock() - startCpu)
         return data
     except sock.timeout:
         trap("Socket operation (receive) timed out")
         return None
     except sock.error as err: # fix this
-        if err.errno == 10054: # The connection has been reset.
+        if err.errno in CONNECTION_LOST or not callback.running:
             callback.connectionLost(err)
+            return None
         else:
             printrap("WARNING - socket error on receive: " + str(err)) # fix this
             raise err
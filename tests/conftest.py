@@ -0,0 +1,9 @@
+"""
+The modules under test are at the top of the repository, not in a package.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
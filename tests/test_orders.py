@@ -0,0 +1,69 @@
+"""
+Tests of orders: the message text and which orders are redundant.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+import orders
+from api.path import Path
+from api.units import Limo
+
+
+class Passenger(object):
+    def __init__(self, name):
+        self.name = name
+
+class Me(object):
+    def __init__(self, tile, path=(), pickup=()):
+        self.limo = Limo(tile, 0, list(path))
+        self.pickup = list(pickup)
+
+
+def test_formatOrders():
+    alice, bob = Passenger("Alice"), Passenger("Bob & Co")
+    assert (orders.formatOrders("move", Path([(1, 2), (1, 3)]), [alice, bob]) ==
+            "<move><path>1,2;1,3;</path><pick-up>Alice;Bob &amp; Co;</pick-up></move>")
+    assert orders.formatOrders("move", [(1, 2)], []) == "<move><path>1,2;</path></move>"
+    assert orders.formatOrders("ready", [], []) == "<ready />"
+
+def test_formatOrdersSameForPathAndList():
+    tiles = [(4, 5), (4, 6), (5, 6)]
+    assert (orders.formatOrders("move", Path(tiles), []) ==
+            orders.formatOrders("move", tiles, []))
+
+def test_samePathIsRedundant():
+    me = Me((1, 1), [(1, 1), (1, 2), (1, 3)])
+    assert orders.isRedundant(me, Path([(1, 1), (1, 2), (1, 3)]), [])
+    # with or without the tile we are on, as a Path or a list
+    assert orders.isRedundant(me, Path([(1, 2), (1, 3)]), [])
+    assert orders.isRedundant(me, [(1, 1), (1, 2), (1, 3)], [])
+
+def test_differentPathIsNotRedundant():
+    me = Me((1, 1), [(1, 1), (1, 2), (1, 3)])
+    assert not orders.isRedundant(me, Path([(1, 1), (1, 2)]), [])
+    assert not orders.isRedundant(me, Path([(1, 1), (2, 1), (2, 2)]), [])
+
+def test_pickup():
+    alice, bob = Passenger("Alice"), Passenger("Bob")
+    me = Me((1, 1), [(1, 1), (1, 2)], [alice])
+    assert orders.isRedundant(me, [], [alice])
+    assert not orders.isRedundant(me, [], [bob])
+    assert not orders.isRedundant(me, [(1, 1), (1, 2)], [alice, bob])
+
+def test_explicitStopIsNeverRedundant():
+    me = Me((1, 1))
+    assert not orders.isRedundant(me, [], [])
+    assert not orders.isRedundant(me, Path(), [])
+
+def test_suppressing(monkeypatch):
+    monkeypatch.setattr(orders, "ENABLED", True)
+    monkeypatch.setattr(orders, "stats", orders.OrderStats())
+    sent = []
+    class Brain(object):
+        me = Me((1, 1), [(1, 1), (1, 2)])
+    send = orders.suppressing(lambda brain, order, path, pickup: sent.append(order))
+    send(Brain, "move", [(1, 1), (1, 2)], [])
+    send(Brain, "ready", [(1, 1), (1, 2)], [])
+    send(Brain, "move", [(1, 1), (2, 1)], [])
+    assert sent == ["ready", "move"]
+    assert orders.stats.sent == 2 and orders.stats.suppressed == 1
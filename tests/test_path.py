@@ -0,0 +1,43 @@
+"""
+Tests of api.path.Path: parsing and formatting <path> text, and behaving as
+a list of tiles.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from api.path import Path, tileId, tileXY
+
+
+def test_tileIds():
+    assert tileXY(tileId(3, 65535)) == (3, 65535)
+    assert tileId(1, 2) == 1 << 16 | 2
+
+def test_parse():
+    path = Path.parse("1,2;3,4;10,0;")
+    assert list(path) == [(1, 2), (3, 4), (10, 0)]
+    assert path == [(1, 2), (3, 4), (10, 0)]
+
+def test_parseToleratesSpacesAndNoTrailingSemicolon():
+    assert list(Path.parse(" 1,2; 3,4")) == [(1, 2), (3, 4)]
+    assert len(Path.parse("")) == 0
+
+def test_format():
+    assert Path([(1, 2), (3, 4)]).format() == "1,2;3,4;"
+    assert Path().format() == ""
+
+def test_formatParseRoundTrip():
+    tiles = [(x, y) for x in (0, 1, 255, 32767) for y in (0, 7, 65535)]
+    path = Path(tiles)
+    assert Path.parse(path.format()) == path
+    assert list(Path.parse(path.format())) == tiles
+
+def test_listOperations():
+    path = Path([(0, 0), (0, 1)])
+    path.append((0, 2))
+    path.insert(0, (1, 0))
+    assert path[0] == (1, 0) and path[-1] == (0, 2)
+    assert (0, 1) in path and (5, 5) not in path
+    assert path.pop(0) == (1, 0)
+    assert isinstance(path[1:], Path) and list(path[1:]) == [(0, 1), (0, 2)]
+    assert list(path + [(0, 3)]) == [(0, 0), (0, 1), (0, 2), (0, 3)]
+    assert path != Path([(0, 0)])
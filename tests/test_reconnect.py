@@ -0,0 +1,58 @@
+"""
+Tests of reconnect: the backoff between attempts and reconnecting on the
+background thread.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import random, threading
+
+import reconnect
+
+
+def test_firstAttemptIsImmediate():
+    assert reconnect.Reconnector(None).delay(0) == 0
+
+def test_backoffDoublesWithJitter():
+    connector = reconnect.Reconnector(None, first=.1, cap=100, rand=random.Random(1))
+    for attempt in range(1, 8):
+        ceiling = .1 * 2 ** (attempt - 1)
+        for i in range(20):
+            assert ceiling / 2 <= connector.delay(attempt) <= ceiling
+
+def test_backoffIsCapped():
+    connector = reconnect.Reconnector(None, first=.1, cap=5.0, rand=random.Random(2))
+    delays = [connector.delay(50) for i in range(50)]
+    assert all(2.5 <= d <= 5.0 for d in delays)
+
+def test_retriesUntilConnected():
+    done = threading.Event()
+    calls = []
+    def connect():
+        calls.append(1)
+        if len(calls) < 3:
+            raise IOError("refused")
+        done.set()
+    connector = reconnect.Reconnector(connect, first=.001, cap=.002)
+    try:
+        assert connector.lost()
+        assert done.wait(5)
+        assert connector.failures == 2 and connector.attempt == 3
+        assert connector.resumed() is not None
+        assert connector.attempt == 0 and connector.lostAt is None
+        assert connector.resumed() is None
+    finally:
+        connector.close()
+
+def test_lossesWhileReconnectingAreCoalesced():
+    release = threading.Event()
+    connector = reconnect.Reconnector(lambda: release.wait(5))
+    try:
+        assert connector.lost()
+        assert not connector.lost()
+        assert connector.outages == 1 and connector.coalesced == 1
+    finally:
+        release.set()
+        connector.close()
@@ -0,0 +1,92 @@
+"""
+Tests of scoring: the masks, the candidates chosen and their ranking, with
+NumPy and without.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import pytest
+
+import scoring
+
+MODES = [False] + ([True] if scoring.numpy is not None else [])
+
+
+@pytest.fixture(params=MODES, ids=lambda numpy: "numpy" if numpy else "plain")
+def useNumpy(request, monkeypatch):
+    monkeypatch.setattr(scoring, "USE_NUMPY", request.param)
+    return request.param
+
+def makeBatch(rows):
+    """rows -- (free, placed, delivered, riding, refuses, points,
+    toPassenger, toDestination) for each candidate."""
+    batch = scoring.Candidates(len(rows))
+    for i, row in enumerate(rows):
+        (batch.free[i], batch.placed[i], batch.delivered[i], batch.riding[i],
+         batch.refuses[i], batch.points[i], batch.toPassenger[i],
+         batch.toDestination[i]) = row
+    return batch
+
+
+def test_masks(useNumpy):
+    batch = makeBatch([(1, 1, 0, 0, 0, 1, 1, 1),   # eligible and preferred
+                       (1, 1, 0, 0, 1, 1, 1, 1),   # eligible, refuses
+                       (0, 1, 0, 0, 0, 1, 1, 1),   # in a limo
+                       (1, 0, 0, 0, 0, 1, 1, 1),   # not placed
+                       (1, 1, 1, 0, 0, 1, 1, 1),   # delivered
+                       (1, 1, 0, 1, 0, 1, 1, 1)])  # riding with us
+    scoring.masks(batch)
+    assert list(batch.eligible) == [1, 1, 0, 0, 0, 0]
+    assert list(batch.preferred) == [1, 0, 0, 0, 0, 0]
+
+def test_chosenPrefersThoseWhoWouldGetOut(useNumpy):
+    batch = makeBatch([(1, 1, 0, 0, 1, 1, 1, 1),
+                       (1, 1, 0, 0, 0, 1, 1, 1),
+                       (1, 1, 0, 0, 1, 1, 1, 1)])
+    scoring.masks(batch)
+    assert scoring.chosen(batch) == [1]
+
+def test_chosenFallsBackToEligible(useNumpy):
+    batch = makeBatch([(1, 1, 0, 0, 1, 1, 1, 1),
+                       (0, 1, 0, 0, 0, 1, 1, 1),
+                       (1, 1, 0, 0, 1, 1, 1, 1)])
+    scoring.masks(batch)
+    assert scoring.chosen(batch) == [0, 2]
+
+def test_chosenEmpty(useNumpy):
+    batch = makeBatch([(0, 1, 0, 0, 0, 1, 1, 1)])
+    scoring.masks(batch)
+    assert scoring.chosen(batch) == []
+    assert scoring.rank(batch) == []
+    assert scoring.chosen(scoring.Candidates(0)) == []
+
+def test_rankBestScoreFirstTiesInIndexOrder(useNumpy):
+    batch = makeBatch([(1, 1, 0, 0, 0, 1, 5, 5),    # 10
+                       (1, 1, 0, 0, 0, 3, 5, 5),    # 30
+                       (1, 1, 0, 0, 0, 2, 10, 10),  # 10
+                       (1, 1, 0, 0, 0, 2, 1, 1)])   # 100
+    scoring.masks(batch)
+    assert scoring.rank(batch) == [3, 1, 0, 2]
+    assert scoring.rank(batch, [0, 1, 2]) == [1, 0, 2]
+
+def test_score():
+    batch = makeBatch([(1, 1, 0, 0, 0, 3, 4, 2)])
+    assert scoring.score(batch, 0) == 50
+
+def test_rankSameWithAndWithoutNumpy(monkeypatch):
+    if scoring.numpy is None:
+        pytest.skip("needs NumPy")
+    import random
+    rand = random.Random(7)
+    rows = [(rand.randint(0, 1), rand.randint(0, 1), rand.randint(0, 1), rand.randint(0, 1),
+             rand.randint(0, 1), rand.randint(1, 3), rand.randint(1, 30), rand.randint(1, 30))
+            for i in range(200)]
+    results = []
+    for useNumpy in (False, True):
+        monkeypatch.setattr(scoring, "USE_NUMPY", useNumpy)
+        batch = makeBatch(rows)
+        scoring.masks(batch)
+        results.append((list(batch.eligible), list(batch.preferred), scoring.rank(batch)))
+    assert results[0] == results[1]
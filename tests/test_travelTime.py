@@ -0,0 +1,78 @@
+"""
+Tests of travelTime: the entry and turn costs of each tile, and path times.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+from xml.etree import ElementTree as ET
+
+import travelTime
+from api import map
+
+# a road from (0, 1) east to (3, 1), crossed at (2, 1) by a road from (2, 0)
+# south to (2, 2)
+ROADS = {(0, 1): {'direction': 'EAST_WEST'},
+         (1, 1): {'direction': 'EAST_WEST', 'signal': 'true'},
+         (2, 1): {'direction': 'INTERSECTION', 'stop-sign': 'STOP_NORTH, STOP_WEST'},
+         (3, 1): {'direction': 'EAST_WEST'},
+         (2, 0): {'direction': 'CURVE_SE'},
+         (2, 2): {'direction': 'NORTH_SOUTH'}}
+WIDTH, HEIGHT = 4, 3
+
+
+def makeMap():
+    element = ET.Element('map', {'width': str(WIDTH), 'height': str(HEIGHT),
+                                 'units-tile': '24'})
+    for x in range(WIDTH):
+        for y in range(HEIGHT):
+            attrs = {'x': str(x), 'y': str(y), 'type': 'PARK'}
+            if (x, y) in ROADS:
+                attrs['type'] = 'ROAD'
+                attrs.update(ROADS[(x, y)])
+            ET.SubElement(element, 'tile', attrs)
+    return map.Map(element, [])
+
+def entryCost(entry, tile, heading):
+    return entry[(tile[0] * HEIGHT + tile[1]) * 4 + heading]
+
+
+def test_heading():
+    assert [travelTime.heading(a) for a in (0, 90, 180, 270, 359, 44)] == [0, 1, 2, 3, 0, 0]
+
+def test_tileCosts():
+    entry, turn = travelTime.tileCosts(makeMap())
+    TICK = travelTime.TICK
+    assert [entryCost(entry, (0, 1), h) for h in range(4)] == [TICK] * 4
+    assert entryCost(entry, (1, 1), 1) == TICK + travelTime.SIGNAL
+    assert entryCost(entry, (2, 0), 2) == TICK + travelTime.CURVE
+    # the sign on the north side stops cars coming in moving south, the one
+    # on the west side cars moving east
+    assert entryCost(entry, (2, 1), 2) == TICK + travelTime.STOP
+    assert entryCost(entry, (2, 1), 1) == TICK + travelTime.STOP
+    assert entryCost(entry, (2, 1), 0) == TICK
+    assert entryCost(entry, (2, 1), 3) == TICK
+    # not driveable
+    assert [entryCost(entry, (0, 0), h) for h in range(4)] == [0] * 4
+    assert turn[2 * HEIGHT + 1] == travelTime.TURN
+    assert turn[0 * HEIGHT + 1] == 0
+
+def test_mapBuildsTablesWhenUsed():
+    gmap = makeMap()
+    assert gmap._tileCosts is None
+    assert list(gmap.entryCosts) == list(travelTime.tileCosts(gmap)[0])
+    assert gmap.turnCosts == travelTime.tileCosts(gmap)[1]
+
+def test_pathTime():
+    gmap = makeMap()
+    straight = [(0, 1), (1, 1), (2, 1), (3, 1)]
+    TICK = travelTime.TICK
+    assert travelTime.pathTime(gmap, straight, 1) == (
+        3 * TICK + travelTime.SIGNAL + travelTime.STOP) / TICK
+    turning = [(0, 1), (1, 1), (2, 1), (2, 2)]
+    assert travelTime.pathTime(gmap, turning, 1) == (
+        3 * TICK + travelTime.SIGNAL + travelTime.STOP + travelTime.TURN) / TICK
+    # starting the wrong way round costs a U-turn
+    assert travelTime.pathTime(gmap, straight, 3) == (
+        travelTime.pathTime(gmap, straight, 1) + travelTime.UTURN / TICK)
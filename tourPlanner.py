@@ -0,0 +1,255 @@
+"""
+Module tourPlanner: looks ahead over the next few deliveries to pick the best
+passenger to go get now.
+
+The greedy ranking in MyPlayerBrain.allPickups scores each passenger on its
+own. This searches sequences of up to DEPTH deliveries - go to a lobby, carry
+the passenger to their destination, go to the next lobby - and scores a tour
+by the points delivered, each discounted by how long it takes to get them:
+
+    value = sum(pointsDelivered * DISCOUNT ** ticksUntilDelivered)
+
+Discounting makes the value of the rest of a tour depend only on where it
+starts and which deliveries have already been made (times DISCOUNT ** ticks
+so far), so those subproblems are memoised. A branch is pruned when even
+delivering the most valuable remaining passengers with no travel cost could
+not beat the best tour found so far, or the value the caller needs. A
+subsearch that beats what it needed is exact despite pruning; one that does
+not only shows the best is at most what it needed, and is memoised with that
+bound, to answer later searches that need as much or more. The search stops at NODE_LIMIT nodes or
+TIME_BUDGET seconds and returns the best first move found.
+
+A delivery is left out if one of the passenger's enemies is waiting at their
+destination (they would refuse to get out). After a passenger is delivered
+the next stop on their route becomes a candidate, from where we left them.
+
+All travel costs come from a table of distances between bus stops (see
+StopDistances), each computed at most once per game - looked up in the
+setupPipeline.DistanceTables when they have it, else searched for.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import instrument
+import simpleAStar
+
+DEPTH = 3
+"""Number of deliveries looked ahead."""
+DISCOUNT = .98
+"""Value kept per tick of delay in a delivery."""
+NODE_LIMIT = 20000
+"""Most search nodes expanded per plan."""
+TIME_BUDGET = .1
+"""Most seconds spent per plan."""
+CANDIDATES = 12
+"""Only the best this many first pickups (by greedy score) are searched."""
+
+
+class StopDistances(dict):
+    """{(busStopFrom, busStopTo): ticks} that finds each path the first time
+    it is asked for and remembers it for the rest of the game."""
+
+    def __init__(self, gmap, tables=None):
+        """gmap -- The game map.
+        tables -- setupPipeline.DistanceTables to take distances from, if any.
+
+        """
+        dict.__init__(self)
+        self.gmap = gmap
+        self.tables = tables
+
+    def __missing__(self, key):
+        instrument.count('stopDistances.misses')
+        start, end = key
+        ticks = None
+        if self.tables is not None:
+            ticks = self.tables.distance(start, end)
+        if ticks is None or ticks < 0:
+            ticks = 0 if start == end else len(simpleAStar.calculatePath(self.gmap, start, end)) - 1
+        self[key] = ticks
+        return ticks
+
+
+class Leg(object):
+    """One delivery: carry passenger from lobby (a Company) to destination."""
+    __slots__ = ('passenger', 'lobby', 'destination', 'points', 'index', 'nextLeg')
+
+    def __init__(self, passenger, lobby, destination, index):
+        self.passenger = passenger
+        self.lobby = lobby
+        self.destination = destination
+        self.points = passenger.pointsDelivered
+        self.index = index
+        self.nextLeg = None
+
+    def __repr__(self):
+        return "Leg<%s: %s -> %s>" % (self.passenger.name, self.lobby.name,
+                                      self.destination.name)
+
+
+class TourPlanner(object):
+    """Plans tours over a fixed table of bus stop to bus stop distances."""
+
+    def __init__(self, stopDistance, depth=DEPTH, discount=DISCOUNT,
+                 nodeLimit=NODE_LIMIT, timeBudget=TIME_BUDGET):
+        """stopDistance -- {(busStopFrom, busStopTo): ticks}, see StopDistances.
+        depth -- Number of deliveries looked ahead.
+        discount -- Value kept per tick of delay.
+        nodeLimit -- Most search nodes expanded per plan.
+        timeBudget -- Most seconds spent per plan.
+        nodes -- Search nodes expanded by the last plan.
+        complete -- False if the last plan was cut short by a limit.
+
+        """
+        self.stopDistance = stopDistance
+        self.depth = depth
+        self.discount = discount
+        self.nodeLimit = nodeLimit
+        self.timeBudget = timeBudget
+        self.nodes = 0
+        self.complete = True
+
+    @instrument.timed('tourPlan')
+    def plan(self, toStop, legs):
+        """Return (value, [Leg, ...]) for the best tour, or (0, []) if none.
+
+        toStop -- {busStop: ticks from our limo} for every lobby in legs.
+        legs -- The first Leg of every passenger we could go and get.
+
+        """
+        self.nodes = 0
+        self.complete = True
+        self._deadline = instrument.wallClock() + self.timeBudget
+        self._memo = {}
+        discount = self.discount
+        best = (0.0, [])
+        # the best pickups first, so the bound has a good tour to prune against
+        ordered = sorted(legs, reverse=True,
+                         key=lambda l: l.points / (1 + toStop[l.lobby.busStop] +
+                                                   self._travel(l.lobby, l.destination)))
+        for leg in ordered[:CANDIDATES]:
+            if refused(leg):
+                continue
+            ticks = toStop[leg.lobby.busStop] + self._travel(leg.lobby, leg.destination)
+            gain = leg.points * discount ** ticks
+            waiting = frozenset(l for l in legs if l is not leg)
+            if leg.nextLeg is not None:
+                waiting = waiting | frozenset([leg.nextLeg])
+            bound = gain + discount ** ticks * self._optimistic(waiting, self.depth - 1)
+            if bound <= best[0]:
+                continue
+            rest, tour, exact = self._search(leg.destination, waiting, frozenset([leg]),
+                                             self.depth - 1, (best[0] - gain) / discount ** ticks)
+            value = gain + discount ** ticks * rest
+            if value > best[0]:
+                best = (value, [leg] + tour)
+            if not self.complete:
+                break
+        return best
+
+    def _travel(self, fromCompany, toCompany):
+        return self.stopDistance[(fromCompany.busStop, toCompany.busStop)]
+
+    def _optimistic(self, waiting, depth):
+        """Upper bound on the value of depth more deliveries - the best points
+        waiting, as if there were no travel at all."""
+        if depth <= 0 or not waiting:
+            return 0.0
+        points = sorted((l.points for l in waiting), reverse=True)
+        return sum(points[:depth])
+
+    def _search(self, at, waiting, done, depth, needed):
+        """Best (value, tour, exact) of depth more deliveries starting at
+        company at. exact is False if pruning may have hidden a better tour.
+
+        waiting -- Legs that could be delivered next.
+        done -- Legs already delivered on this tour (for the memo key and the
+            enemy check).
+        needed -- The value this has to beat to matter; used to prune.
+
+        """
+        if depth <= 0 or not waiting:
+            return 0.0, [], True
+        key = (at.busStop, done, depth)
+        memo = self._memo.get(key)
+        if memo is not None:
+            value, tour, bound = memo
+            if bound is None:
+                return value, tour, True
+            if needed >= bound:
+                return value, tour, False # still cannot beat what is needed
+        self.nodes += 1
+        if self.nodes >= self.nodeLimit or (not self.nodes & 255 and
+                                            instrument.wallClock() > self._deadline):
+            self.complete = False
+            return 0.0, [], False
+
+        discount = self.discount
+        pickedUp = set(l.passenger for l in done)
+        best = (0.0, [])
+        exact = True
+        candidates = sorted(waiting, key=lambda l: (self._travel(at, l.lobby),
+                                                    l.passenger.name, l.index))
+        for leg in candidates:
+            if refused(leg, pickedUp):
+                continue
+            ticks = self._travel(at, leg.lobby) + self._travel(leg.lobby, leg.destination)
+            weight = discount ** ticks
+            gain = leg.points * weight
+            rest = waiting - frozenset([leg])
+            if leg.nextLeg is not None:
+                rest = rest | frozenset([leg.nextLeg])
+            if gain + weight * self._optimistic(rest, depth - 1) <= max(best[0], needed):
+                exact = False
+                continue
+            value, tour, exactRest = self._search(leg.destination, rest,
+                                                  done | frozenset([leg]), depth - 1,
+                                                  (max(best[0], needed) - gain) / weight)
+            exact = exact and exactRest
+            value = gain + weight * value
+            if value > best[0]:
+                best = (value, [leg] + tour)
+            if not self.complete:
+                return best[0], best[1], False
+        # pruning only hides tours worth no more than what is needed, so a
+        # best that beats it is exact. Otherwise all we know is that nothing
+        # here beats needed - good for any search needing that much or more.
+        if exact or best[0] > needed:
+            self._memo[key] = (best[0], best[1], None)
+            return best[0], best[1], True
+        self._memo[key] = (best[0], best[1], needed)
+        return best[0], best[1], False
+
+
+def refused(leg, pickedUp=()):
+    """True if an enemy of the passenger is waiting at the leg's destination
+    (ignoring passengers in pickedUp, who have left their lobby)."""
+    if not leg.destination.wouldRefuse(leg.passenger):
+        return False
+    if not pickedUp:
+        return True
+    waiting = leg.destination.passengers
+    for enemy in leg.passenger.enemies:
+        if enemy in waiting and enemy not in pickedUp:
+            return True
+    return False
+
+def legsFor(passenger, lobby=None):
+    """Return the first Leg for passenger (from lobby, by default their
+    current one), linked to the legs for the rest of their route."""
+    lobby = passenger.lobby if lobby is None else lobby
+    stops = [passenger.destination] + list(passenger.route)
+    first = previous = None
+    for index, stop in enumerate(stops):
+        if stop == lobby:
+            continue
+        leg = Leg(passenger, lobby, stop, index)
+        if previous is None:
+            first = leg
+        else:
+            previous.nextLeg = leg
+        previous = leg
+        lobby = stop
+    return first
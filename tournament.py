@@ -0,0 +1,183 @@
+"""
+Module tournament: play many games of bots against each other on the local
+server stand-in (localServer.py), spread over all cores, and collect the
+results in one file.
+
+    python tournament.py --games 300 --players 4 --configs configs.json
+
+Each game is played in a worker process with its own Frameworks and brains
+(or, with --headless, with the brains called directly - see simulator.py).
+A brain configuration is a JSON object:
+
+    {"name": "look-ahead", "attributes": {"useLookAhead": true}}
+
+where attributes are set on the MyPlayerBrain before setup. The seats of a
+game are filled with the configurations in turn, rotated from game to game.
+With no --configs file every seat plays the default brain.
+
+Every game writes one line of JSON to --out with the seed, each bot's
+configuration, score, deliveries, turn latency (mean/p50/p99/max seconds,
+null for a bot that had no turns) and messages received, and the game's
+message throughput. A summary by configuration is printed at the end.
+
+The bots share the tables computed for each map through a temporary
+directory (see sharedTables.py), removed at the end; set
+WINDWARD_SHARED_DIR to use (and keep) your own.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os, sys, json, time, shutil, argparse, tempfile, multiprocessing
+
+DEFAULT_CONFIG = {"name": "default", "attributes": {}}
+
+
+def playGame(spec):
+    """Play one game. spec is a dict with seed, configs (one per seat) and
+    ticks. Returns the result dict. Runs in a worker process."""
+    # myPlayerBrain first - it imports sendOrders from framework, which
+    # imports myPlayerBrain back.
+    import myPlayerBrain, framework, localServer
+
+    configs = spec["configs"]
+    names = ["%s#%d" % (c["name"], seat) for seat, c in enumerate(configs)]
+    setup = localServer.generateSetup(spec["seed"], names)
+    frameworks = []
+    for name, config in zip(names, configs):
+        fwk = framework.Framework(["local", name])
+        for attr, value in config.get("attributes", {}).items():
+            setattr(fwk._brain, attr, value)
+        frameworks.append(fwk)
+    server = localServer.LocalServer(setup, frameworks)
+
+    start = time.time()
+    game = server.play(spec["ticks"])
+    elapsed = time.time() - start
+    return gameResult(spec, game, [f.client for f in frameworks], server.latencies,
+                      server.messages, elapsed)
+
+def gameResult(spec, game, clients, latencies, messages, elapsed):
+    """Return the result dict for a finished game.
+
+    clients -- Each player's client (with messagesSent and bytesSent).
+    latencies -- {guid: [seconds for each message]}.
+    messages -- Total messages handled by all the bots.
+    elapsed -- Seconds the game took.
+    """
+    bots = []
+    for player, config, client in zip(game.players, spec["configs"], clients):
+        turns = sorted(latencies.get(player.guid, ()))
+        bot = {"config": config["name"],
+               "score": player.score,
+               "delivered": len(player.passengersDelivered),
+               "turns": len(turns),
+               # a bot that never had a turn (crashed or dropped) has no latency
+               "latencyMean": None, "latencyP50": None,
+               "latencyP99": None, "latencyMax": None,
+               "ordersSent": client.messagesSent,
+               "orderBytes": client.bytesSent}
+        if turns:
+            bot.update({"latencyMean": sum(turns) / len(turns),
+                        "latencyP50": turns[len(turns) // 2],
+                        "latencyP99": turns[int(len(turns) * .99)],
+                        "latencyMax": turns[-1]})
+        bots.append(bot)
+    best = max(b["score"] for b in bots)
+    for bot in bots:
+        bot["won"] = bot["score"] == best
+    return {"seed": spec["seed"], "ticks": game.ticks, "seconds": elapsed,
+            "messages": messages,
+            "messagesPerSecond": messages / elapsed if elapsed else 0.0,
+            "bots": bots}
+
+def gameSpecs(games, players, configs, ticks, firstSeed):
+    for game in range(games):
+        seats = [configs[(game + seat) % len(configs)] for seat in range(players)]
+        yield {"seed": firstSeed + game, "configs": seats, "ticks": ticks}
+
+def summarize(results):
+    """Return {config name: {games, wins, meanScore, meanLatency, p99Latency}}."""
+    byConfig = {}
+    for result in results:
+        for bot in result["bots"]:
+            stats = byConfig.setdefault(bot["config"], {"seats": 0, "wins": 0,
+                                                        "score": 0.0, "latency": 0.0,
+                                                        "timed": 0, "p99": 0.0})
+            stats["seats"] += 1
+            stats["wins"] += bot["won"]
+            stats["score"] += bot["score"]
+            if bot["latencyMean"] is not None:
+                stats["timed"] += 1
+                stats["latency"] += bot["latencyMean"]
+                stats["p99"] = max(stats["p99"], bot["latencyP99"])
+    summary = {}
+    for name, stats in byConfig.items():
+        summary[name] = {"seats": stats["seats"], "wins": stats["wins"],
+                         "meanScore": stats["score"] / stats["seats"],
+                         "meanLatency": stats["latency"] / stats["timed"] if stats["timed"] else 0.0,
+                         "worstP99Latency": stats["p99"]}
+    return summary
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Play many local games in parallel.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=1500, help="most ticks per game")
+    parser.add_argument("--configs", help="JSON file with a list of brain configurations")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first game")
+    parser.add_argument("--out", default="tournament.jsonl", help="results file")
+    parser.add_argument("--headless", action="store_true",
+                        help="call the brains directly (simulator.py) instead of "
+                             "through Frameworks and status XML")
+    args = parser.parse_args(argv)
+
+    configs = [DEFAULT_CONFIG]
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    specs = list(gameSpecs(args.games, args.players, configs, args.ticks, args.seed))
+    # the bots of a game share their map's tables (see sharedTables.py) - set
+    # before the pool starts so the workers see it
+    sharedDir = None
+    if not os.environ.get("WINDWARD_SHARED_DIR"):
+        sharedDir = os.environ["WINDWARD_SHARED_DIR"] = tempfile.mkdtemp(prefix="windward-shared-")
+    start = time.time()
+    results = []
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        with open(args.out, "w") as out:
+            play = playGame
+            if args.headless:
+                import simulator
+                play = simulator.playGame
+            for result in pool.imap_unordered(play, specs):
+                results.append(result)
+                out.write(json.dumps(result) + "\n")
+                print("game %d/%d (seed %d): %s" %
+                      (len(results), len(specs), result["seed"],
+                       ", ".join("%s=%g" % (b["config"], b["score"]) for b in result["bots"])))
+    finally:
+        pool.close()
+        pool.join()
+        if sharedDir is not None:
+            shutil.rmtree(sharedDir, ignore_errors=True)
+    elapsed = time.time() - start
+
+    messages = sum(r["messages"] for r in results)
+    print("\n%d games in %.1f seconds (%.1f games/s, %.0f messages/s)" %
+          (len(results), elapsed, len(results) / elapsed, messages / elapsed))
+    print("%-20s %6s %6s %10s %12s %12s" %
+          ("config", "seats", "wins", "meanScore", "meanLatency", "worstP99"))
+    for name, stats in sorted(summarize(results).items()):
+        print("%-20s %6d %6d %10.2f %12.6f %12.6f" %
+              (name, stats["seats"], stats["wins"], stats["meanScore"],
+               stats["meanLatency"], stats["worstP99Latency"]))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""
+Module travelTime: how long driving onto each tile takes, for routing by
+time instead of by tiles (weightedPath.calculateFastestPath).
+
+    entry, turn = tileCosts(gmap)    # done once, by api.map.Map
+    entry[index * 4 + heading]       # cost of entering tile index moving heading
+    turn[index]                      # extra cost of turning on that tile
+
+Headings are 0 north, 1 east, 2 south, 3 west (as limo angles 0, 90, 180,
+270). Costs are in 1/TICK of a tick, so a plain tile costs TICK:
+    STOP -- entering past a stop sign on the side we come in from (a sign
+        on the north side, STOP_NORTH, stops traffic coming in moving south).
+    SIGNAL -- entering a tile with a traffic signal: the average wait.
+    CURVE -- driving round a curve.
+    TURN -- turning at an intersection or T (leaving in a different
+        direction from the one we came in, other than straight back).
+    UTURN -- going back the way we came.
+
+The numbers are estimates of the real server's driving, not measured; the
+local game (localServer.py) moves every limo one tile per tick whatever the
+tile, so there the shortest route is also the fastest.
+
+Both tables are compact arrays (2 bytes per tile and heading, 1 byte per
+tile) made once when the Map is built.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+from array import array
+
+TICK = 10
+"""Cost of one tile with nothing on it."""
+STOP = 20
+SIGNAL = 10
+CURVE = 5
+TURN = 5
+UTURN = 40
+TYPECODE = 'H'
+HEADINGS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+"""Tile step for each heading."""
+
+# the STOP_SIGNS bit for the side a car moving in each heading comes in by
+_SIGN_FOR_HEADING = (0x04, 0x08, 0x01, 0x02)
+_TURNING = ("INTERSECTION", "T_NORTH", "T_EAST", "T_SOUTH", "T_WEST")
+
+
+def heading(angle):
+    """The heading (0-3) nearest a limo angle in degrees."""
+    return int(round(angle / 90)) % 4
+
+def tileCosts(gmap):
+    """(entry, turn) for gmap - see the module docstring. Tiles that are not
+    driveable cost 0 (the search never enters them)."""
+    height = gmap.height
+    entry = array(TYPECODE, [0]) * (gmap.width * height * 4)
+    turn = bytearray(gmap.width * height)
+    for x, column in enumerate(gmap.squares):
+        for y, square in enumerate(column):
+            if square is None or not square.isDriveable():
+                continue
+            index = x * height + y
+            cost = TICK
+            if square.signal:
+                cost += SIGNAL
+            if square.direction.startswith("CURVE"):
+                cost += CURVE
+            for h in range(4):
+                entry[index * 4 + h] = cost + (STOP if square.stopSigns & _SIGN_FOR_HEADING[h] else 0)
+            if square.direction in _TURNING:
+                turn[index] = TURN
+    return entry, turn
+
+def pathTime(gmap, path, start=None):
+    """Ticks to drive path (tiles, from where we are) by this model. start is
+    the heading we begin with, if known."""
+    height = gmap.height
+    entry, turn = gmap.entryCosts, gmap.turnCosts
+    total = 0
+    current = start
+    for (x0, y0), (x1, y1) in zip(path, path[1:]):
+        h = HEADINGS.index((x1 - x0, y1 - y0))
+        if current is not None and h != current:
+            total += UTURN if h == (current + 2) % 4 else turn[x0 * height + y0]
+        total += entry[(x1 * height + y1) * 4 + h]
+        current = h
+    return total / TICK
@@ -0,0 +1,213 @@
+"""
+Module weightedPath: a textbook A* over tile indexes, for routes where tiles
+do not all cost the same.
+
+    path = calculateWeightedPath(gmap, start, end)
+    path = calculateWeightedPath(gmap, start, end, extraCost=congestion.cost)
+    path = calculateWeightedPath(gmap, start, end, weight=1.5)
+
+Every step onto a driveable tile costs 1 tick plus extraCost(tile, step) if
+given - tile is the index x * height + y of the tile entered and step the
+number of steps taken to get there, so a cost can depend on when we would
+arrive (see congestion.py). The estimate is the map's landmark bound
+(Landmarks.indexHeuristic) or Manhattan distance, which stays a lower bound
+with extra costs as they are never negative - so the path found is the
+cheapest. With weight > 1 the estimate is multiplied by weight: far fewer
+tiles are expanded, and the path costs at most weight times the cheapest.
+
+    path = calculateFastestPath(gmap, start, end, heading)
+
+calculateFastestPath routes by time rather than tiles: a step costs the
+map's precomputed travelTime entry cost for the tile and the heading it is
+entered in (stop signs, signals, curves), plus travelTime's turn or U-turn
+cost when the heading changes. The search is over (tile, heading) states;
+the estimate is the tile bound times travelTime.TICK, the least any tile
+costs, so the route found is the fastest by that model. extraCost and weight
+work as above, extraCost still in ticks.
+
+The result is an api.path.Path from start to end (inclusive), or an empty
+Path if there is no way. Unlike simpleAStar.calculatePath these searches are
+exact; they work on the map's grid and tile indexes, keeping one heap entry
+per state reached rather than a node object.
+
+No copyright claimed - do anything you want with this code.
+"""
+
+from __future__ import division
+
+import heapq
+from array import array
+
+import instrument
+import travelTime
+from api.path import Path, TYPECODE
+
+# totals over every search, as simpleAStar's
+searches = 0
+expansions = 0
+
+
+def manhattanIndex(goal, height):
+    """Manhattan distance to goal, for tile indexes."""
+    gx, gy = goal
+    def estimate(i):
+        x, y = divmod(i, height)
+        return abs(x - gx) + abs(y - gy)
+    return estimate
+
+@instrument.timed('weightedSearch')
+def calculateWeightedPath(gmap, start, end, extraCost=None, weight=1.0):
+    """The cheapest path from start to end (see the module docstring).
+
+    gmap -- The game map (its grid and landmarks are used).
+    start -- The tile the path starts on.
+    end -- The tile the path ends on.
+    extraCost -- function(tile index, steps) -> ticks to add for entering
+        that tile after that many steps (>= 0), or None.
+    weight -- Multiplier for the estimate (1 for the cheapest path).
+
+    """
+    global searches, expansions
+    if start == end:
+        return Path([start])
+    height = gmap.height
+    size = gmap.width * height
+    grid = gmap.grid
+    source = start[0] * height + start[1]
+    goal = end[0] * height + end[1]
+    if not (0 <= goal < size and grid[goal]):
+        return Path()
+    lm = getattr(gmap, 'landmarks', None)
+    estimate = lm.indexHeuristic(end) if lm else manhattanIndex(end, height)
+
+    cost = {source: 0}
+    steps = {source: 0}
+    previous = {source: -1}
+    frontier = [(weight * estimate(source), 0, source)]
+    heappush, heappop = heapq.heappush, heapq.heappop
+    expanded = 0
+    while frontier:
+        _, spent, tile = heappop(frontier)
+        if spent > cost[tile]:
+            continue # reached more cheaply since this was pushed
+        expanded += 1
+        if tile == goal:
+            break
+        step = steps[tile] + 1
+        y = tile % height
+        for neighbor in (tile - height, tile + height,
+                         tile - 1 if y > 0 else -1,
+                         tile + 1 if y < height - 1 else -1):
+            if not (0 <= neighbor < size and grid[neighbor]):
+                continue
+            total = spent + 1
+            if extraCost is not None:
+                total += extraCost(neighbor, step)
+            known = cost.get(neighbor)
+            if known is None or total < known:
+                cost[neighbor] = total
+                steps[neighbor] = step
+                previous[neighbor] = tile
+                heappush(frontier, (total + weight * estimate(neighbor), total, neighbor))
+    searches += 1
+    expansions += expanded
+
+    if goal not in previous:
+        return Path()
+    return _walkBack(previous, goal, height, 1)
+
+def _walkBack(previous, last, height, per):
+    """The Path ending at state last, following previous (-1 at the start);
+    states are tile index * per + something."""
+    ids = array(TYPECODE)
+    state = last
+    while state >= 0:
+        x, y = divmod(state // per, height)
+        ids.append(x << 16 | y)
+        state = previous[state]
+    ids.reverse()
+    return Path.fromIds(ids)
+
+@instrument.timed('fastestSearch')
+def calculateFastestPath(gmap, start, end, heading=None, extraCost=None, weight=1.0):
+    """The fastest path from start to end by travelTime's costs (see the
+    module docstring).
+
+    gmap -- The game map (its grid, entryCosts, turnCosts and landmarks are
+        used).
+    start -- The tile the path starts on.
+    end -- The tile the path ends on.
+    heading -- The heading (0-3, see travelTime.heading) we are driving in
+        at start, or None to leave start in any direction without cost.
+    extraCost -- function(tile index, steps) -> ticks to add for entering
+        that tile after that many steps (>= 0), or None.
+    weight -- Multiplier for the estimate (1 for the fastest path).
+
+    """
+    global searches, expansions
+    if start == end:
+        return Path([start])
+    height = gmap.height
+    size = gmap.width * height
+    grid = gmap.grid
+    entry, turn = gmap.entryCosts, gmap.turnCosts
+    tick, uturn = travelTime.TICK, travelTime.UTURN
+    source = start[0] * height + start[1]
+    goal = end[0] * height + end[1]
+    if not (0 <= goal < size and grid[goal]):
+        return Path()
+    lm = getattr(gmap, 'landmarks', None)
+    estimate = lm.indexHeuristic(end) if lm else manhattanIndex(end, height)
+    weight *= tick
+    # tile offset of a step in each heading: north, east, south, west
+    offsets = (-1, height, 1, -height)
+
+    cost = {}
+    steps = {}
+    previous = {}
+    frontier = []
+    first = weight * estimate(source)
+    for h in (range(4) if heading is None else (heading,)):
+        state = source * 4 + h
+        cost[state] = 0
+        steps[state] = 0
+        previous[state] = -1
+        frontier.append((first, 0, state))
+    heappush, heappop = heapq.heappush, heapq.heappop
+    expanded = 0
+    found = -1
+    while frontier:
+        _, spent, state = heappop(frontier)
+        if spent > cost[state]:
+            continue # reached more cheaply since this was pushed
+        expanded += 1
+        tile, h = divmod(state, 4)
+        if tile == goal:
+            found = state
+            break
+        step = steps[state] + 1
+        y = tile % height
+        for nh in range(4):
+            if (nh == 0 and y == 0) or (nh == 2 and y == height - 1):
+                continue
+            neighbor = tile + offsets[nh]
+            if not (0 <= neighbor < size and grid[neighbor]):
+                continue
+            nstate = neighbor * 4 + nh
+            total = spent + entry[nstate]
+            if nh != h:
+                total += uturn if nh == (h + 2) % 4 else turn[tile]
+            if extraCost is not None:
+                total += tick * extraCost(neighbor, step)
+            known = cost.get(nstate)
+            if known is None or total < known:
+                cost[nstate] = total
+                steps[nstate] = step
+                previous[nstate] = state
+                heappush(frontier, (total + weight * estimate(neighbor), total, nstate))
+    searches += 1
+    expansions += expanded
+
+    if found < 0:
+        return Path()
+    return _walkBack(previous, found, height, 4)